@@ -0,0 +1,128 @@
+"""
+Shared fixtures for the benchmark suite.
+
+The size of the runs is controlled by the CSCAPI_BENCH_SCALE environment
+variable: "small" (default), "medium" or "full". Peak memory is measured in a
+separate tracemalloc pass, which can be disabled with CSCAPI_BENCH_MEMORY=0.
+"""
+
+import os
+import time
+import tracemalloc
+
+import httpx
+import jwt
+import pytest
+
+from cscapi.client import (
+    CAPI_DECISIONS_URL,
+    CAPI_WATCHER_LOGIN_URL,
+    CAPIClient,
+)
+from cscapi.sql_storage import SQLStorage
+from cscapi.utils import create_signals
+
+SCALE = os.environ.get("CSCAPI_BENCH_SCALE", "small")
+MEASURE_MEMORY = os.environ.get("CSCAPI_BENCH_MEMORY", "1") != "0"
+
+SIGNAL_COUNTS = {
+    "small": [1000],
+    "medium": [1000, 100_000],
+    "full": [1000, 100_000, 1_000_000],
+}[SCALE]
+
+MACHINE_COUNTS = {
+    "small": [1, 100],
+    "medium": [1, 100, 10_000],
+    "full": [1, 100, 10_000],
+}[SCALE]
+
+SIGNALS_AND_MACHINES = [
+    (signals, machines)
+    for signals in SIGNAL_COUNTS
+    for machines in MACHINE_COUNTS
+    if machines <= signals
+]
+
+
+def make_token():
+    return jwt.encode(
+        {"sub": "bench", "exp": int(time.time()) + 3600},
+        "benchmark-secret-of-at-least-32-bytes",
+        algorithm="HS256",
+    )
+
+
+def capi_handler():
+    token = make_token()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == CAPI_WATCHER_LOGIN_URL:
+            return httpx.Response(200, json={"token": token})
+        if request.url == CAPI_DECISIONS_URL:
+            return httpx.Response(200, json={"new": [], "deleted": []})
+        return httpx.Response(200, json={"message": "OK"})
+
+    return handler
+
+
+def make_signals(count, machines):
+    return create_signals(
+        [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(count)],
+        "crowdsecurity/ssh-bf",
+        [1700000000 + i // 100 for i in range(count)],
+        [f"machine-{i % machines}" for i in range(count)],
+    )
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    """Build a CAPIClient on a fresh SQLite file with a mocked CAPI transport"""
+    counter = iter(range(1_000_000))
+    storages = []
+
+    def factory(signals=0, machines=1, sent=False) -> CAPIClient:
+        storage = SQLStorage(f"sqlite:///{tmp_path / f'bench-{next(counter)}.db'}")
+        storages.append(storage)
+        client = CAPIClient(storage)
+        client.http_client = httpx.Client(
+            transport=httpx.MockTransport(capi_handler()),
+            headers=client.http_client.headers,
+        )
+        if signals:
+            to_add = make_signals(signals, machines)
+            for signal in to_add:
+                signal.sent = sent
+            storage.bulk_create_signals(to_add)
+        return client
+
+    yield factory
+
+    for storage in storages:
+        storage.session.close()
+
+
+def run(benchmark, fn, setup, items):
+    """Time `fn` once per round on fresh state and record throughput and memory.
+
+    `setup` returns the argument passed to `fn`.
+    """
+    benchmark.pedantic(
+        fn, setup=lambda: ((setup(),), {}), rounds=_rounds(items), iterations=1
+    )
+    benchmark.extra_info["items"] = items
+    benchmark.extra_info["items_per_second"] = items / benchmark.stats.stats.mean
+
+    if MEASURE_MEMORY:
+        arg = setup()
+        tracemalloc.start()
+        try:
+            fn(arg)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_bytes"] = peak
+
+
+def _rounds(items):
+    return 5 if items <= 10_000 else 1
@@ -0,0 +1,208 @@
+"""
+Load test: a fleet of machines sending signals through CAPIClient to the local
+mock CAPI (`cscapi.mock_capi`), over real HTTP with injected latency, errors
+and throttling.
+
+    python -m benchmarks.load_test --machines 10000 --latency 0.005 --throttle-rate 0.01
+
+Reports the end-to-end throughput and the latency percentiles of each CAPI
+endpoint as seen by the client. The mock CAPI runs in the same process, so its
+threads compete with the client's for the GIL: compare runs with each other
+rather than with production numbers.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Counter, Dict, List, Optional
+
+from cscapi.client import CAPIClient
+from cscapi.metrics import NoopMetrics
+from cscapi.mock_capi import Latency, MockCAPI
+from cscapi.sql_storage import SQLStorage
+from cscapi.utils import create_signals
+
+SCENARIO = "crowdsecurity/ssh-bf"
+
+
+class LatencyRecorder(NoopMetrics):
+    """Keep every CAPI request duration, per endpoint"""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, labels=None):
+        if name == "capi_request_duration_seconds":
+            with self._lock:
+                self.durations[labels["endpoint"]].append(value)
+
+
+@dataclass
+class LoadReport:
+    machines: int
+    signals: int
+    signals_sent: int = 0
+    # signals CAPI received, more than signals_sent when failed rounds re-sent
+    signals_received: int = 0
+    # send rounds, failed ones are retried up to max_attempts
+    attempts: int = 0
+    failed_attempts: int = 0
+    # seconds per phase: add, warm and send
+    durations: Dict[str, float] = field(default_factory=dict)
+    # (endpoint, status) -> responses, as counted by the mock CAPI
+    responses: Counter = field(default_factory=Counter)
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        return self.durations.get("warm", 0.0) + self.durations.get("send", 0.0)
+
+    @property
+    def signals_per_second(self) -> float:
+        return self.signals_sent / self.seconds if self.seconds else 0.0
+
+    def percentiles(self, endpoint: str) -> Dict[str, float]:
+        durations = sorted(self.latencies.get(endpoint, []))
+        if not durations:
+            return {}
+        return {
+            name: durations[min(len(durations) - 1, int(q * len(durations)))]
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1))
+        }
+
+    def summary(self) -> str:
+        lines = [
+            f"{self.machines} machines, {self.signals_sent}/{self.signals} signals "
+            f"sent in {self.seconds:.2f}s ({self.signals_per_second:.0f} signals/s), "
+            f"{self.attempts} attempts, {self.signals_received} signals received",
+        ]
+        for endpoint in sorted(self.latencies):
+            stats = ", ".join(
+                f"{name} {seconds * 1000:.1f}ms"
+                for name, seconds in self.percentiles(endpoint).items()
+            )
+            lines.append(
+                f"  {endpoint:<10} {len(self.latencies[endpoint]):>7} requests  {stats}"
+            )
+        errors = {key: n for key, n in self.responses.items() if key[1] >= 400}
+        if errors:
+            lines.append(f"  errors: {errors}")
+        return "\n".join(lines)
+
+
+def run_load(
+    machines: int = 10_000,
+    signals_per_machine: int = 1,
+    latency: Latency = 0.0,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    max_workers: int = 32,
+    max_attempts: int = 5,
+    chunk_size: int = 100,
+    seed: Optional[int] = None,
+) -> LoadReport:
+    """Register the fleet, log it in and send its signals to a mock CAPI"""
+    count = machines * signals_per_machine
+    report = LoadReport(machines=machines, signals=count)
+    recorder = LatencyRecorder()
+    machine_ids = [f"machine-{i}" for i in range(machines)]
+
+    with tempfile.TemporaryDirectory() as tmp, MockCAPI(
+        latency=latency,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        seed=seed,
+    ) as capi:
+        storage = SQLStorage(f"sqlite:///{os.path.join(tmp, 'load.db')}")
+        client = CAPIClient(
+            storage, metrics=recorder, max_workers=max_workers, base_url=capi.base_url
+        )
+
+        start = time.perf_counter()
+        client.add_signals(
+            create_signals(
+                [
+                    f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+                    for i in range(count)
+                ],
+                SCENARIO,
+                [1700000000 + i // 100 for i in range(count)],
+                [machine_ids[i % machines] for i in range(count)],
+            )
+        )
+        report.durations["add"] = time.perf_counter() - start
+
+        # registration and login are concurrent; send_signals would do them
+        # one machine at a time per failure, so warm the fleet first
+        start = time.perf_counter()
+        client.warm_machines(machine_ids, [SCENARIO])
+        report.durations["warm"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        while report.attempts < max_attempts:
+            report.attempts += 1
+            try:
+                # sent chunks stay sent when a later one fails, and the
+                # signals of a failed chunk can be claimed again right away
+                client.send_signals(
+                    max_signals=count, claim_limit=chunk_size, lease_seconds=0
+                )
+                break
+            except Exception:
+                report.failed_attempts += 1
+                client.warm_machines(machine_ids, [SCENARIO])
+        report.durations["send"] = time.perf_counter() - start
+
+        report.signals_sent = count - storage.count_unsent_signals()
+        client.close()
+        storage.session.close()
+        report.signals_received = capi.signals_received
+        report.responses = capi.requests.copy()
+    report.latencies = dict(recorder.durations)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load_test",
+        description="Send a simulated fleet's signals to a local mock CAPI",
+    )
+    parser.add_argument("--machines", type=int, default=10_000)
+    parser.add_argument("--signals-per-machine", type=int, default=1)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        nargs="+",
+        default=[0.0],
+        help="seconds, or a min and max to draw from",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    latency = args.latency[0] if len(args.latency) == 1 else tuple(args.latency[:2])
+    report = run_load(
+        machines=args.machines,
+        signals_per_machine=args.signals_per_machine,
+        latency=latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_workers=args.workers,
+        max_attempts=args.max_attempts,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+    )
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
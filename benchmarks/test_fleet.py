@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from .conftest import MACHINE_COUNTS
+from .load_test import run_load
+
+
+@pytest.mark.parametrize("machines", MACHINE_COUNTS)
+def test_fleet_send(benchmark, machines):
+    report = benchmark.pedantic(
+        run_load, kwargs={"machines": machines}, rounds=1, iterations=1
+    )
+
+    assert report.signals_sent == machines
+    benchmark.extra_info["items"] = machines
+    benchmark.extra_info["items_per_second"] = report.signals_per_second
+    for endpoint in report.latencies:
+        for name, seconds in report.percentiles(endpoint).items():
+            benchmark.extra_info[f"{endpoint}_{name}_seconds"] = seconds
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def import_time_us(module):
+    """Cumulative import time of `module` in microseconds from -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    for line in reversed(stderr.splitlines()):
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative)
+    raise AssertionError(f"{module} not found in -X importtime output")
+
+
+@pytest.mark.parametrize(
+    "module", ["cscapi.client", "cscapi.utils", "cscapi.sql_storage"]
+)
+def test_import_time(benchmark, module):
+    times = []
+    benchmark.pedantic(
+        lambda: times.append(import_time_us(module)), rounds=5, iterations=1
+    )
+    benchmark.extra_info["import_time_us"] = min(times)
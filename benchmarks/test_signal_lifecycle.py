@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from cscapi.utils import create_signal
+
+from .conftest import SIGNAL_COUNTS, SIGNALS_AND_MACHINES, make_signals, run
+
+
+@pytest.mark.parametrize("signals", SIGNAL_COUNTS)
+def test_create_signal(benchmark, signals):
+    def fn(columns):
+        for ip, created_at in columns:
+            create_signal(ip, "crowdsecurity/ssh-bf", created_at, "machine-0")
+
+    run(
+        benchmark,
+        fn,
+        lambda: [(f"10.0.0.{i & 255}", 1700000000 + i // 100) for i in range(signals)],
+        signals,
+    )
+
+
+@pytest.mark.parametrize("signals", SIGNAL_COUNTS)
+def test_create_signals(benchmark, signals):
+    run(benchmark, lambda _: make_signals(signals, 1), lambda: None, signals)
+
+
+@pytest.mark.parametrize("signals,machines", SIGNALS_AND_MACHINES)
+def test_add_signals(benchmark, make_client, signals, machines):
+    to_add = make_signals(signals, machines)
+    run(
+        benchmark,
+        lambda client: client.add_signals(to_add),
+        make_client,
+        signals,
+    )
+
+
+@pytest.mark.parametrize("signals", SIGNAL_COUNTS)
+def test_get_all_signals(benchmark, make_client, signals):
+    client = make_client(signals)
+    run(
+        benchmark,
+        lambda client: client.storage.get_all_signals(),
+        lambda: client,
+        signals,
+    )
+
+
+@pytest.mark.parametrize("signals,machines", SIGNALS_AND_MACHINES)
+def test_send_signals(benchmark, make_client, signals, machines):
+    run(
+        benchmark,
+        lambda client: client.send_signals(),
+        lambda: make_client(signals, machines),
+        signals,
+    )
+
+
+@pytest.mark.parametrize("signals", SIGNAL_COUNTS)
+def test_prune_sent_signals(benchmark, make_client, signals):
+    run(
+        benchmark,
+        lambda client: client._prune_sent_signals(),
+        lambda: make_client(signals, sent=True),
+        signals,
+    )
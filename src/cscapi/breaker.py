@@ -0,0 +1,87 @@
+"""
+Circuit breaker for CAPI requests.
+
+After `failure_threshold` consecutive failures (connection errors, timeouts,
+5xx and 429 responses) the circuit opens: requests fail immediately with
+`CircuitOpenError` instead of waiting on a CAPI that is down, and
+`CAPIClient.send_signals` leaves the signals in storage. Once `cooldown`
+seconds have passed, a single probe request is let through (half-open): its
+success closes the circuit, its failure opens it for another cooldown.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger("capi-py-sdk")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """closed, open, or half_open once the cooldown is over"""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if self._probing or self._clock() - self._opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def before_request(self):
+        """Raise CircuitOpenError unless the request may go through"""
+        with self._lock:
+            state = self._state()
+            if state == OPEN:
+                raise CircuitOpenError(
+                    f"CAPI circuit open after {self._failures} consecutive failures"
+                )
+            if state == HALF_OPEN:
+                # this request is the probe, the others wait for its outcome
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("CAPI circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (
+                self._opened_at is None and self._failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    f"CAPI circuit open for {self.cooldown}s after "
+                    f"{self._failures} consecutive failures"
+                )
+                self._opened_at = self._clock()
+                self._probing = False
@@ -1,19 +1,40 @@
+import functools
+import hashlib
+import json
+import os
 import secrets
+import sys
+import threading
 import time
+import uuid
 from collections import defaultdict
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
 import logging
-from typing import Dict, List
-from importlib import metadata
-
-import httpx
-import jwt
-from more_itertools import batched
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
+from cscapi.breaker import OPEN, CircuitBreaker, CircuitOpenError
+from cscapi.metrics import NOOP_METRICS, MetricsInterface
 from cscapi.storage import MachineModel, ReceivedDecision, SignalModel, StorageInterface
+from cscapi.utils import aggregate_signals
+
+# httpx, jwt and importlib.metadata are imported on first use: they dominate
+# the import time of this module and short-lived scripts may never need them.
+
+
+@functools.lru_cache(maxsize=None)
+def _version() -> str:
+    from importlib import metadata
 
+    return metadata.version("cscapi").split("+")[0]
+
+
+def __getattr__(name):
+    if name == "__version__":
+        return _version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-__version__ = metadata.version("cscapi").split("+")[0]
 
 logging.getLogger("capi-py-sdk").addHandler(logging.NullHandler())
 
@@ -25,105 +46,465 @@ CAPI_SIGNALS_URL = f"{CAPI_BASE_URL}/signals"
 CAPI_DECISIONS_URL = f"{CAPI_BASE_URL}/decisions/stream"
 
 
-def machine_token_is_valid(token: str) -> bool:
+T = TypeVar("T")
+R = TypeVar("R")
+
+# How long a worker may log a machine in before others stop waiting for it,
+# and how often they look for the token it stores meanwhile.
+LOGIN_LEASE_SECONDS = 30.0
+LOGIN_WAIT_INTERVAL = 0.2
+
+# machine_id -> lock held by the thread of this process logging the machine in
+_login_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_login_locks_lock = threading.Lock()
+
+
+def _login_lock(machine_id: str) -> threading.Lock:
+    with _login_locks_lock:
+        return _login_locks[machine_id]
+
+
+def machine_token_is_valid(token: str, min_validity: float = 0) -> bool:
+    # `min_validity` requires the token to stay valid for that many more seconds
+    import jwt
+
     try:
         payload = jwt.decode(token, options={"verify_signature": False})
     except jwt.exceptions.DecodeError:
         return False
     current_time = time.time()
-    return current_time < payload["exp"]
+    return current_time + min_validity < payload["exp"]
+
+
+def make_http_client(
+    max_connections: Optional[int] = 100,
+    max_keepalive_connections: Optional[int] = 20,
+    keepalive_expiry: Optional[float] = 30.0,
+    http2: bool = False,
+    **kwargs,
+):
+    """An httpx.Client for CAPI with the given pool limits.
+
+    `http2` requires the h2 package (`pip install cscapi[http2]`), other
+    keyword arguments are passed to `httpx.Client`.
+    """
+    import httpx
+
+    client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2,
+        **kwargs,
+    )
+    client.headers.update({"User-Agent": f"capi-py-sdk/{_version()}"})
+    return client
+
+
+def _memory_usage() -> int:
+    # resident memory of the process in bytes, the peak where the current
+    # value can't be read
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class SendReport:
+    signals_read: int = 0
+    signals_uploaded: int = 0
+    signals_sent: int = 0
+    signals_pruned: int = 0
+    machines_registered: int = 0
+    machines_logged_in: int = 0
+    machines_cached: int = 0
+    batches: int = 0
+    bytes_uploaded: int = 0
+    # what stopped the run early, if anything: "circuit_open" when CAPI is
+    # failing (see CircuitBreaker), or when draining with budgets the budget
+    # that was hit ("max_signals", "deadline" or "max_memory"), in which case
+    # signals_remaining counts the unsent signals left
+    stopped_by: Optional[str] = None
+    signals_remaining: int = 0
+    # wall-clock seconds per phase: storage_read, grouping, auth, aggregate,
+    # upload, mark_sent and prune
+    durations: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.durations.values())
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = (
+                self.durations.get(name, 0.0) + time.perf_counter() - start
+            )
+
+
+@dataclass
+class WarmReport:
+    machines_registered: int = 0
+    machines_logged_in: int = 0
+    machines_cached: int = 0
+    # machine_id -> error for machines that could not be authenticated
+    failures: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _CachedDecisions:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    decisions: Any
+
+
+@dataclass
+class EnrollResult:
+    machine_id: str
+    # "enrolled", "skipped" (already enrolled the same way) or "failed"
+    status: str
+    error: Optional[str] = None
 
 
 class CAPIClient:
-    def __init__(self, storage: StorageInterface):
+    def __init__(
+        self,
+        storage: StorageInterface,
+        metrics: Optional[MetricsInterface] = None,
+        max_workers: int = 8,
+        max_batch_bytes: int = 512 * 1024,
+        max_batch_size: int = 250,
+        http_client=None,
+        base_url: str = CAPI_BASE_URL,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        login_lease_seconds: float = LOGIN_LEASE_SECONDS,
+    ):
+        """
+        `http_client` is an `httpx.Client` to use instead of creating one, for
+        instance one from `make_http_client` shared by several CAPIClients (see
+        `cscapi.tenants.TenantPool`). It is not closed by `close()`.
+
+        `base_url` points the client to another CAPI, such as the local
+        `cscapi.mock_capi.MockCAPI`.
+
+        `circuit_breaker` defaults to a `CircuitBreaker()` of this client, pass
+        one to share it between clients talking to the same CAPI.
+
+        When a machine's token expires, one worker logs it in while the others,
+        in this process or sharing the storage, wait up to `login_lease_seconds`
+        for the new token, see `_login_machines`.
+        """
         self.storage = storage
-        self.http_client = httpx.Client()
-        self.http_client.headers.update({"User-Agent": f"capi-py-sdk/{__version__}"})
+        self.base_url = base_url.rstrip("/")
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.metrics = metrics or NOOP_METRICS
+        # number of concurrent register/login/enroll calls
+        self.max_workers = max_workers
+        # signal uploads are split to stay under max_batch_bytes of JSON body,
+        # and max_batch_size signals per request
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_size = max_batch_size
+        # machine_id -> validators and parsed body of the last decisions poll
+        self._decisions_cache: Dict[str, _CachedDecisions] = {}
+        self._decisions_cache_lock = threading.Lock()
+        # polls answered from the cache (304 Not Modified) or downloaded
+        self.decisions_cache_hits = 0
+        self.decisions_cache_misses = 0
+        self.login_lease_seconds = login_lease_seconds
+        # identifies this client's machine leases in the storage
+        self._lease_holder = uuid.uuid4().hex
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or make_http_client()
+
+    def close(self):
+        if self._owns_http_client:
+            self.http_client.close()
 
     def add_signals(self, signals: List[SignalModel]):
+        # stored signals are updated, only new ones go through the bulk insert
+        new = [signal for signal in signals if signal.alert_id is None]
         for signal in signals:
-            self.storage.update_or_create_signal(signal)
+            if signal.alert_id is not None:
+                self.storage.update_or_create_signal(signal)
+        if new:
+            self.storage.bulk_create_signals(new)
+
+    def send_signals(
+        self,
+        prune_after_send: bool = False,
+        aggregation_window: Optional[float] = None,
+        claim_limit: Optional[int] = None,
+        lease_seconds: float = 300,
+        max_signals: Optional[int] = None,
+        deadline: Optional[float] = None,
+        max_memory: Optional[int] = None,
+    ) -> "SendReport":
+        """Upload unsent signals and mark them as sent.
+
+        When `aggregation_window` is set, signals with the same machine_id,
+        source ip and scenario within that many seconds are merged into a single
+        uploaded signal (see `cscapi.utils.aggregate_signals`).
+
+        When `claim_limit` is set, only up to that many signals are claimed from
+        the storage for `lease_seconds`, so several workers can send from the
+        same storage without uploading the same signals twice.
+
+        Setting any of `max_signals`, `deadline` (seconds) or `max_memory`
+        (process resident memory, in bytes) drains the backlog in chunks of
+        `claim_limit` signals (default 1000) until one of these budgets is hit
+        or nothing is left. A chunk is not started when the previous one
+        suggests it would overrun the deadline. The report tells which budget
+        stopped the run and how many unsent signals remain.
+        """
+        report = SendReport()
+        if self.circuit_breaker.state == OPEN:
+            # CAPI is down: leave the signals in storage for a later run
+            report.stopped_by = "circuit_open"
+            return report
 
-    def send_signals(self, prune_after_send: bool = False):
-        unsent_signals: List[SignalModel] = list(
-            filter(lambda signal: not signal.sent, self.storage.get_all_signals())
-        )
-        signals_by_machineid: Dict[str, List[SignalModel]] = defaultdict(list)
-        for signal in unsent_signals:
-            signals_by_machineid[signal.machine_id].append(signal)
+        try:
+            if max_signals is None and deadline is None and max_memory is None:
+                with report.phase("storage_read"):
+                    if claim_limit is not None:
+                        unsent_signals = self.storage.claim_signals(
+                            claim_limit, lease_seconds
+                        )
+                    else:
+                        unsent_signals: List[SignalModel] = list(
+                            filter(
+                                lambda signal: not signal.sent,
+                                self.storage.get_all_signals(),
+                            )
+                        )
+                self.metrics.gauge("signals_unsent", len(unsent_signals))
+                self._send_chunk(report, unsent_signals, aggregation_window)
+            else:
+                self._drain(
+                    report,
+                    aggregation_window,
+                    claim_limit or 1000,
+                    lease_seconds,
+                    max_signals,
+                    deadline,
+                    max_memory,
+                )
+        except CircuitOpenError:
+            # the circuit opened during this run, unsent signals stay stored
+            report.stopped_by = "circuit_open"
+            return report
+
+        if prune_after_send:
+            with report.phase("prune"):
+                report.signals_pruned = self._prune_sent_signals()
+
+        return report
+
+    def _drain(
+        self,
+        report: SendReport,
+        aggregation_window: Optional[float],
+        chunk_size: int,
+        lease_seconds: float,
+        max_signals: Optional[int],
+        deadline: Optional[float],
+        max_memory: Optional[int],
+    ):
+        start = time.monotonic()
+        while True:
+            limit = chunk_size
+            if max_signals is not None:
+                limit = min(limit, max_signals - report.signals_read)
+            with report.phase("storage_read"):
+                signals = self.storage.claim_signals(limit, lease_seconds)
+            if not signals:
+                break
+            chunk_start = time.monotonic()
+            self._send_chunk(report, signals, aggregation_window)
+            elapsed = time.monotonic() - start
+            # expect the next chunk to take as long as this one
+            next_chunk = time.monotonic() - chunk_start
+
+            if max_signals is not None and report.signals_read >= max_signals:
+                report.stopped_by = "max_signals"
+            elif deadline is not None and elapsed + next_chunk >= deadline:
+                report.stopped_by = "deadline"
+            elif max_memory is not None and _memory_usage() >= max_memory:
+                report.stopped_by = "max_memory"
+            if report.stopped_by:
+                break
+
+        with report.phase("storage_read"):
+            report.signals_remaining = self.storage.count_unsent_signals()
+        self.metrics.gauge("signals_unsent", report.signals_remaining)
+
+    def _send_chunk(
+        self,
+        report: SendReport,
+        unsent_signals: List[SignalModel],
+        aggregation_window: Optional[float],
+    ):
+        report.signals_read += len(unsent_signals)
 
         machines_to_register = []
         machines_to_login = []
         machines_by_id: Dict[str, MachineModel] = {}
 
-        for machine_id, signals in signals_by_machineid.items():
-            machine = self.storage.get_machine_by_id(machine_id)
-            signals_scenarios = ",".join(
-                sorted(set([signal.scenario for signal in signals]))
-            )
-            if not machine:
-                machines_to_register.append(
-                    MachineModel(
-                        machine_id=machine_id,
-                        scenarios=signals_scenarios,
-                        password=secrets.token_urlsafe(22),
-                    )
+        with report.phase("grouping"):
+            signals_by_machineid: Dict[str, List[SignalModel]] = defaultdict(list)
+            for signal in unsent_signals:
+                signals_by_machineid[signal.machine_id].append(signal)
+
+            for machine_id, signals in signals_by_machineid.items():
+                machine = self.storage.get_machine_by_id(machine_id)
+                signals_scenarios = ",".join(
+                    sorted(set([signal.scenario for signal in signals]))
                 )
+                if not machine:
+                    machines_to_register.append(
+                        MachineModel(
+                            machine_id=machine_id,
+                            scenarios=signals_scenarios,
+                            password=secrets.token_urlsafe(22),
+                        )
+                    )
 
-            elif not machine_token_is_valid(machine.token):
-                machines_to_login.append(
-                    MachineModel(
-                        machine_id=machine_id,
-                        scenarios=signals_scenarios,
-                        password=machine.password,
+                elif not machine_token_is_valid(machine.token):
+                    machines_to_login.append(
+                        replace(machine, scenarios=signals_scenarios)
                     )
-                )
 
-            else:
-                machines_by_id[machine_id] = machine
+                else:
+                    machines_by_id[machine_id] = machine
+        report.machines_registered += len(machines_to_register)
+        report.machines_logged_in += len(machines_to_login)
+        report.machines_cached += len(machines_by_id)
 
-        # For higher performance we can use async here.
-        updated_machines = list(map(self._make_machine, machines_to_register))
-        updated_machines.extend(
-            list(map(self._refresh_machine_token, machines_to_login))
-        )
+        with report.phase("auth"):
+            updated_machines, failures = self._make_machines(
+                machines_to_register, machines_to_login
+            )
+        if failures:
+            raise failures[0][1]
 
         machines_by_id = {
             machine.machine_id: machine for machine in updated_machines
         } | machines_by_id
 
-        for machine_id, signals in signals_by_machineid.items():
-            token = machines_by_id[machine_id].token
-            self._send_signals(token, signals)
-
-        for signal in unsent_signals:
-            signal.sent = True
-            self.storage.update_or_create_signal(signal)
-
-        if prune_after_send:
-            self._prune_sent_signals()
-
-    def _send_signals(self, token: str, signals: SignalModel):
-        for signal_batch in batched(signals, 250):
-            body = [asdict(signal) for signal in signal_batch]
-            resp = self.http_client.post(
-                CAPI_SIGNALS_URL, json=body, headers={"Authorization": token}
+        if aggregation_window is not None:
+            with report.phase("aggregate"):
+                signals_by_machineid = {
+                    machine_id: aggregate_signals(signals, aggregation_window)
+                    for machine_id, signals in signals_by_machineid.items()
+                }
+
+        with report.phase("upload"):
+            for machine_id, signals in signals_by_machineid.items():
+                report.signals_uploaded += len(signals)
+                token = machines_by_id[machine_id].token
+                batches, size = self._send_signals(token, signals)
+                report.batches += batches
+                report.bytes_uploaded += size
+
+        with report.phase("mark_sent"):
+            self.storage.mark_signals_sent(unsent_signals)
+        report.signals_sent += len(unsent_signals)
+
+    def _send_signals(self, token: str, signals: List[SignalModel]) -> Tuple[int, int]:
+        # returns the number of batches and bytes uploaded
+        batches, size = 0, 0
+        for count, body in self._signal_batches(signals):
+            self.metrics.observe("signals_batch_size", count)
+            self.metrics.observe("signals_batch_bytes", len(body))
+            resp = self._request(
+                "POST",
+                "signals",
+                f"{self.base_url}/signals",
+                content=body,
+                headers={"Authorization": token, "Content-Type": "application/json"},
             )
             resp.raise_for_status()
+            batches += 1
+            size += len(body)
+        return batches, size
+
+    def _signal_batches(
+        self, signals: List[SignalModel]
+    ) -> Iterator[Tuple[int, bytes]]:
+        # Each signal is encoded once and the body is the join of the encoded
+        # items, so the running size is exact: "[" + items + "," separators + "]".
+        # A signal bigger than the budget on its own is sent alone.
+        items: List[bytes] = []
+        size = 2
+        for signal in signals:
+            item = json.dumps(asdict(signal)).encode()
+            if items and (
+                size + len(item) + 1 > self.max_batch_bytes
+                or len(items) >= self.max_batch_size
+            ):
+                yield len(items), b"[" + b",".join(items) + b"]"
+                items, size = [], 2
+            size += len(item) + (1 if items else 0)
+            items.append(item)
+        if items:
+            yield len(items), b"[" + b",".join(items) + b"]"
+
+    def _request(self, method: str, endpoint: str, url: str, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            try:
+                self.circuit_breaker.before_request()
+            except CircuitOpenError:
+                status = "circuit_open"
+                raise
+            try:
+                resp = self.http_client.request(method, url, **kwargs)
+            except Exception:
+                self.circuit_breaker.record_failure()
+                raise
+            status = str(resp.status_code)
+            if resp.status_code >= 500 or resp.status_code == 429:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            return resp
+        finally:
+            labels = {"endpoint": endpoint, "status": status}
+            self.metrics.increment("capi_requests_total", labels=labels)
+            self.metrics.observe(
+                "capi_request_duration_seconds", time.perf_counter() - start, labels
+            )
 
-    def _prune_sent_signals(self):
-        signals = filter(lambda signal: signal.sent, self.storage.get_all_signals())
+    def _prune_sent_signals(self) -> int:
+        signals = [signal for signal in self.storage.get_all_signals() if signal.sent]
         self.storage.delete_signals(signals)
+        return len(signals)
 
-    def _refresh_machine_token(self, machine: MachineModel) -> MachineModel:
-        resp = self.http_client.post(
-            CAPI_WATCHER_LOGIN_URL,
+    def _login(self, machine: MachineModel) -> MachineModel:
+        resp = self._request(
+            "POST",
+            "login",
+            f"{self.base_url}/watchers/login",
             json={
                 "machine_id": machine.machine_id,
                 "password": machine.password,
                 "scenarios": machine.scenarios.split(","),
             },
         )
+        import httpx
+
         try:
             resp.raise_for_status()
         except httpx.HTTPStatusError as exc:
@@ -132,20 +513,119 @@ class CAPIClient:
             )
             raise exc
 
-        new_machine = asdict(machine)
-        new_machine["token"] = resp.json()["token"]
-        new_machine = MachineModel(**new_machine)
-        self.storage.update_or_create_machine(new_machine)
-        return new_machine
+        return replace(machine, token=resp.json()["token"])
 
-    def _register_machine(self, machine: MachineModel) -> MachineModel:
-        resp = self.http_client.post(
-            CAPI_WATCHER_REGISTER_URL,
+    def _refresh_machine_token(self, machine: MachineModel) -> MachineModel:
+        machines, failures = self._login_machines([machine])
+        if failures:
+            raise failures[0][1]
+        return machines[0]
+
+    def _claim_login(self, machine_id: str) -> bool:
+        lock = _login_lock(machine_id)
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            acquired = self.storage.acquire_machine_lease(
+                machine_id, self._lease_holder, self.login_lease_seconds
+            )
+        except BaseException:
+            lock.release()
+            raise
+        if not acquired:
+            lock.release()
+        return acquired
+
+    def _release_login(self, machine_id: str):
+        try:
+            self.storage.release_machine_lease(machine_id, self._lease_holder)
+        finally:
+            _login_lock(machine_id).release()
+
+    def _stored_valid_machine(self, machine: MachineModel) -> Optional[MachineModel]:
+        # a token another worker stored since `machine` was read
+        stored = self.storage.get_machine_by_id(machine.machine_id)
+        if (
+            stored
+            and stored.token
+            and stored.token != machine.token
+            and machine_token_is_valid(stored.token)
+        ):
+            self.metrics.increment("machine_logins_total", labels={"result": "reused"})
+            return stored
+        return None
+
+    def _login_machines(
+        self, to_login: List[MachineModel]
+    ) -> Tuple[List[MachineModel], List[Tuple[MachineModel, Exception]]]:
+        """Log machines in concurrently, one worker per machine at a time.
+
+        A machine is only logged in by the thread holding its in-process lock
+        and its storage lease. The other workers wait for it and reuse the
+        token it stores, or log the machine in themselves once the lease is
+        released or expired without a valid token.
+        """
+        machines, failures = [], []
+        pending = list(to_login)
+        while True:
+            claimed, waiting = [], []
+            for machine in pending:
+                if self._claim_login(machine.machine_id):
+                    claimed.append(machine)
+                else:
+                    waiting.append(machine)
+
+            to_refresh = []
+            try:
+                for machine in claimed:
+                    # the previous holder may have released the lease just now
+                    stored = self._stored_valid_machine(machine)
+                    if stored:
+                        machines.append(stored)
+                    else:
+                        to_refresh.append(machine)
+                for machine, new_machine, error in self._map_concurrently(
+                    self._login, to_refresh
+                ):
+                    if error:
+                        failures.append((machine, error))
+                        continue
+                    self.metrics.increment(
+                        "machine_logins_total", labels={"result": "login"}
+                    )
+                    self.storage.update_or_create_machine(new_machine)
+                    machines.append(new_machine)
+            finally:
+                for machine in claimed:
+                    self._release_login(machine.machine_id)
+
+            if not waiting:
+                return machines, failures
+            time.sleep(LOGIN_WAIT_INTERVAL)
+            pending = []
+            for machine in waiting:
+                stored = self._stored_valid_machine(machine)
+                if stored:
+                    machines.append(stored)
+                else:
+                    pending.append(machine)
+
+    def _register(self, machine: MachineModel):
+        resp = self._request(
+            "POST",
+            "register",
+            f"{self.base_url}/watchers",
             json={
                 "machine_id": machine.machine_id,
                 "password": machine.password,
             },
         )
+        # a machine whose registration failed must not be stored, its
+        # password would never be accepted
+        resp.raise_for_status()
+
+    def _register_machine(self, machine: MachineModel) -> MachineModel:
+        self._register(machine)
         self.storage.update_or_create_machine(machine)
         return machine
 
@@ -153,6 +633,81 @@ class CAPIClient:
         machine = self._register_machine(machine)
         return self._refresh_machine_token(machine)
 
+    def _map_concurrently(
+        self, fn: Callable[[T], R], items: List[T]
+    ) -> List[Tuple[T, Optional[R], Optional[Exception]]]:
+        # Only the HTTP calls run in worker threads, callers do storage writes
+        # from their own thread since storages are not required to be thread-safe.
+        def call(item):
+            try:
+                return item, fn(item), None
+            except Exception as exc:
+                return item, None, exc
+
+        if self.max_workers <= 1 or len(items) <= 1:
+            return [call(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            return list(pool.map(call, items))
+
+    def _make_machines(
+        self, to_register: List[MachineModel], to_login: List[MachineModel]
+    ) -> Tuple[List[MachineModel], List[Tuple[MachineModel, Exception]]]:
+        """Register and log in machines concurrently, storing each outcome.
+
+        Returns the authenticated machines and the (machine, error) failures.
+        """
+        failures = []
+        registered = []
+        for machine, _, error in self._map_concurrently(self._register, to_register):
+            if error:
+                failures.append((machine, error))
+                continue
+            # store before logging in so the password survives a failed login
+            self.storage.update_or_create_machine(machine)
+            registered.append(machine)
+
+        machines, login_failures = self._login_machines(registered + to_login)
+        return machines, failures + login_failures
+
+    def warm_machines(
+        self, machine_ids: List[str], scenarios: List[str], min_validity: float = 300
+    ) -> WarmReport:
+        """Register and log in machines ahead of their first send_signals.
+
+        Unknown machines are registered, and machines whose token expires within
+        `min_validity` seconds are logged in again, `max_workers` at a time.
+        """
+        scenarios = ",".join(sorted(set(scenarios)))
+        report = WarmReport()
+        to_register, to_login = [], []
+        for machine_id in dict.fromkeys(machine_ids):
+            machine = self.storage.get_machine_by_id(machine_id)
+            if not machine:
+                to_register.append(
+                    MachineModel(
+                        machine_id=machine_id,
+                        password=secrets.token_urlsafe(22),
+                        scenarios=scenarios,
+                    )
+                )
+            elif not machine_token_is_valid(machine.token, min_validity):
+                to_login.append(replace(machine, scenarios=scenarios))
+            else:
+                report.machines_cached += 1
+
+        _, failures = self._make_machines(to_register, to_login)
+        failed = {machine.machine_id for machine, _ in failures}
+        report.machines_registered = len(
+            [m for m in to_register if m.machine_id not in failed]
+        )
+        report.machines_logged_in = len(
+            [m for m in to_login if m.machine_id not in failed]
+        )
+        report.failures = {
+            machine.machine_id: str(error) for machine, error in failures
+        }
+        return report
+
     def get_decisions(
         self, main_machine_id: str, scenarios: List[str]
     ) -> List[ReceivedDecision]:
@@ -168,46 +723,102 @@ class CAPIClient:
             )
 
         elif not machine_token_is_valid(machine.token):
-            machine = self._refresh_machine_token(
-                MachineModel(
-                    machine_id=main_machine_id,
-                    password=machine.password,
-                    scenarios=scenarios,
-                )
-            )
-
-        resp = self.http_client.get(
-            CAPI_DECISIONS_URL, headers={"Authorization": machine.token}
+            machine = self._refresh_machine_token(replace(machine, scenarios=scenarios))
+
+        headers = {"Authorization": machine.token}
+        cached = self._decisions_cache.get(main_machine_id)
+        if cached:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        resp = self._request(
+            "GET", "decisions", f"{self.base_url}/decisions/stream", headers=headers
         )
 
-        return resp.json()
+        if cached and resp.status_code == 304:
+            self._count_decisions_poll("hit")
+            return cached.decisions
+        self._count_decisions_poll("miss")
+        decisions = resp.json()
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if resp.status_code == 200 and (etag or last_modified):
+            self._decisions_cache[main_machine_id] = _CachedDecisions(
+                etag, last_modified, decisions
+            )
+        return decisions
+
+    def _count_decisions_poll(self, result: str):
+        with self._decisions_cache_lock:
+            if result == "hit":
+                self.decisions_cache_hits += 1
+            else:
+                self.decisions_cache_misses += 1
+        self.metrics.increment("decisions_cache_total", labels={"result": result})
 
     def enroll_machines(
         self, machine_ids: List[str], name: str, attachment_key: str, tags: List[str]
-    ):
-        for machine_id in machine_ids:
+    ) -> List["EnrollResult"]:
+        """Enroll machines with their own token, `max_workers` at a time.
+
+        Machines already enrolled with the same name, attachment key and tags
+        are skipped. Returns one EnrollResult per machine_id.
+        """
+        enrollment = hashlib.sha256(
+            json.dumps([name, attachment_key, sorted(tags)]).encode()
+        ).hexdigest()
+        results: Dict[str, EnrollResult] = {}
+        to_register, to_login, ready = [], [], []
+
+        # a repeated machine_id would be registered twice with two passwords
+        for machine_id in dict.fromkeys(machine_ids):
             machine = self.storage.get_machine_by_id(machine_id)
             if not machine:
-                machine = self._make_machine(
+                to_register.append(
                     MachineModel(
                         machine_id=machine_id,
                         password=secrets.token_urlsafe(22),
                         scenarios="",
                     )
                 )
+            elif machine.enrollment == enrollment:
+                results[machine_id] = EnrollResult(machine_id, "skipped")
             elif not machine_token_is_valid(machine.token):
-                machine = self._refresh_machine_token(
-                    MachineModel(
-                        machine_id=machine_id, password=machine.password, scenarios=""
-                    )
-                )
+                to_login.append(machine)
+            else:
+                ready.append(machine)
+
+        authenticated, failures = self._make_machines(to_register, to_login)
+        for machine, error in failures:
+            results[machine.machine_id] = EnrollResult(
+                machine.machine_id, "failed", str(error)
+            )
 
-            self.http_client.post(
-                CAPI_ENROLL_URL,
+        def enroll(machine: MachineModel):
+            resp = self._request(
+                "POST",
+                "enroll",
+                f"{self.base_url}/watchers/enroll",
                 json={
                     "name": name,
                     "overwrite": True,
                     "attachment_key": attachment_key,
                     "tags": tags,
                 },
+                headers={"Authorization": machine.token},
+            )
+            resp.raise_for_status()
+
+        for machine, _, error in self._map_concurrently(enroll, ready + authenticated):
+            if error:
+                results[machine.machine_id] = EnrollResult(
+                    machine.machine_id, "failed", str(error)
+                )
+                continue
+            self.storage.update_or_create_machine(
+                replace(machine, enrollment=enrollment)
             )
+            results[machine.machine_id] = EnrollResult(machine.machine_id, "enrolled")
+
+        return [results[machine_id] for machine_id in machine_ids]
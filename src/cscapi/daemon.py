@@ -0,0 +1,283 @@
+"""
+Long-running signal collector.
+
+Short-lived processes submit NDJSON signals over a UNIX socket (or a localhost
+TCP port) instead of opening the storage and talking to CAPI themselves. The
+daemon buffers them in memory, persists them through the storage's bulk path
+from a single worker thread and flushes them to CAPI on a schedule, reusing
+the one connection pool of its CAPIClient.
+
+    cscapi-daemon --socket /tmp/cscapi.sock --db sqlite:///cscapi.db
+
+    from cscapi.daemon import submit_signals
+    submit_signals(signals, "/tmp/cscapi.sock")
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+from dataclasses import asdict
+from typing import List, Tuple, Union
+
+from cscapi.client import CAPIClient
+from cscapi.storage import SignalModel
+
+logger = logging.getLogger("capi-py-sdk")
+
+DEFAULT_SOCKET_PATH = "/tmp/cscapi.sock"
+
+Address = Union[str, Tuple[str, int]]
+
+
+class _SignalHandler(socketserver.StreamRequestHandler):
+    # stop() waits for in-flight connections, don't let an idle one hang it
+    timeout = 30
+
+    def handle(self):
+        from dacite import DaciteError, from_dict
+
+        daemon: SignalDaemon = self.server.signal_daemon
+        accepted, rejected, batch = 0, 0, []
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                parsed = from_dict(SignalModel, json.loads(line))
+            except (ValueError, TypeError, DaciteError):
+                rejected += 1
+                continue
+            if not (parsed.machine_id and parsed.scenario and parsed.source):
+                rejected += 1
+                continue
+            parsed.alert_id = None
+            parsed.sent = False
+            batch.append(parsed)
+            if len(batch) >= daemon.batch_size:
+                daemon.submit(batch)
+                accepted += len(batch)
+                batch = []
+
+        if batch:
+            daemon.submit(batch)
+            accepted += len(batch)
+        self.wfile.write(
+            json.dumps({"accepted": accepted, "rejected": rejected}).encode() + b"\n"
+        )
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+class SignalDaemon:
+    def __init__(
+        self,
+        client: CAPIClient,
+        address: Address = DEFAULT_SOCKET_PATH,
+        flush_interval: float = 10.0,
+        batch_size: int = 1000,
+        max_pending: int = 100000,
+    ):
+        self.client = client
+        self.address = address
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+
+        # accepted signals the storage rejected, e.g. on a constraint violation
+        self.signals_dropped = 0
+        self._pending: List[SignalModel] = []
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        if isinstance(address, str):
+            _remove_stale_socket(address)
+            self.server = _UnixServer(address, _SignalHandler)
+        else:
+            self.server = _TCPServer(address, _SignalHandler)
+        self.server.signal_daemon = self
+
+    def submit(self, signals: List[SignalModel]):
+        """Queue signals for persistence, blocking while the buffer is full"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._stopping or len(self._pending) < self.max_pending
+            )
+            self._pending.extend(signals)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._run_worker, name="cscapi-daemon-worker"),
+            threading.Thread(
+                target=self.server.serve_forever, name="cscapi-daemon-server"
+            ),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop accepting signals, persist the buffer and do a last flush"""
+        self.server.shutdown()
+        self.server.server_close()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if isinstance(self.address, str):
+            _remove_stale_socket(self.address)
+        self._stopped.set()
+
+    def serve_forever(self):
+        self.start()
+        self._stopped.wait()
+
+    def _run_worker(self):
+        # Only this thread touches the storage, so a single SQLite session is safe
+        last_flush = time.monotonic()
+        # signals left unsent by a previous run are flushed too
+        needs_flush = True
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    timeout=max(
+                        0.0, last_flush + self.flush_interval - time.monotonic()
+                    ),
+                )
+                batch, self._pending = self._pending, []
+                stopping = self._stopping
+                self._condition.notify_all()
+
+            if batch:
+                needs_flush = self._store(batch) or needs_flush
+
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if needs_flush and (stopping or due):
+                needs_flush = not self._flush()
+            if due:
+                last_flush = time.monotonic()
+            if stopping:
+                return
+
+    def _store(self, batch: List[SignalModel]) -> bool:
+        """Persist a batch, returns whether any of its signals were stored"""
+        try:
+            self.client.add_signals(batch)
+            return True
+        except Exception:
+            logger.exception(
+                f"Error while storing {len(batch)} signals, storing them one by one"
+            )
+        # the batch was accepted, only drop the signals the storage rejects
+        stored = 0
+        for item in batch:
+            try:
+                self.client.add_signals([item])
+                stored += 1
+            except Exception as e:
+                self.signals_dropped += 1
+                logger.error(
+                    f"Dropping a signal of machine {item.machine_id} "
+                    f"the storage rejects: {e}"
+                )
+        return stored > 0
+
+    def _flush(self) -> bool:
+        try:
+            report = self.client.send_signals(prune_after_send=True)
+        except Exception:
+            # signals stay unsent in storage and are retried on the next flush
+            logger.exception("Error while flushing signals to CAPI")
+            return False
+        if report.stopped_by == "circuit_open":
+            logger.warning("CAPI circuit open, signals stay in storage")
+            return False
+        logger.info(
+            f"flushed {report.signals_sent} signals in {report.total_seconds:.2f}s"
+        )
+        return True
+
+
+def _remove_stale_socket(path: str):
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def submit_signals(
+    signals: List[SignalModel],
+    address: Address = DEFAULT_SOCKET_PATH,
+    timeout: float = 10.0,
+) -> dict:
+    """Send signals to a running daemon, returns its accepted/rejected counts"""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+    else:
+        sock = socket.create_connection(address, timeout=timeout)
+
+    with sock, sock.makefile("rb") as response:
+        sock.sendall(
+            b"".join(json.dumps(asdict(item)).encode() + b"\n" for item in signals)
+        )
+        sock.shutdown(socket.SHUT_WR)
+        return json.loads(response.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cscapi-daemon", description="Collect signals and flush them to CAPI"
+    )
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    listen.add_argument("--listen", help="localhost TCP address as host:port")
+    parser.add_argument("--db", default="sqlite:///cscapi.db")
+    parser.add_argument("--flush-interval", type=float, default=10.0)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    from cscapi.sql_storage import SQLStorage
+
+    address: Address = args.socket
+    if args.listen:
+        host, port = args.listen.rsplit(":", 1)
+        address = (host, int(port))
+
+    logging.basicConfig(level=logging.INFO)
+    daemon = SignalDaemon(
+        CAPIClient(SQLStorage(args.db)),
+        address,
+        flush_interval=args.flush_interval,
+        batch_size=args.batch_size,
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    daemon.start()
+    stop.wait()
+    daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Export received decisions to files a firewall loads in one operation.
+
+    decisions = client.get_decisions(machine_id, scenarios)
+    export_decisions(
+        decisions, "ban.nft", format="nft", state_path="decisions.state"
+    )
+    # nft -f ban.nft
+
+Formats:
+
+- "nft": statements for `nft -f`, filling the crowdsec-blacklists and
+  crowdsec6-blacklists interval sets of the inet crowdsec table
+- "ipset": an `ipset restore` script for hash:net sets of the same names
+- "binary": the sorted networks in a compact file, see `write_networks`
+
+Banned IPs and ranges are merged into the fewest networks: adjacent and
+overlapping ones are collapsed. With a `state_path`, the networks are
+remembered between exports and the "nft" and "ipset" files only hold the
+elements to delete and add since the last export.
+"""
+
+import ipaddress
+import os
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+FORMATS = ("nft", "ipset", "binary")
+
+NFT_FAMILY = "inet"
+NFT_TABLE = "crowdsec"
+SET_NAMES = {4: "crowdsec-blacklists", 6: "crowdsec6-blacklists"}
+
+# magic, format version, number of IPv4 then IPv6 networks, followed by the
+# sorted networks as packed address + prefix length
+_BINARY_HEADER = struct.Struct("!4sBII")
+_BINARY_MAGIC = b"CSNL"
+_BINARY_VERSION = 1
+
+# elements per nft statement
+_NFT_CHUNK = 1000
+
+
+@dataclass
+class ExportReport:
+    # networks written to the set(s) and removed from them by this export
+    added: int = 0
+    removed: int = 0
+    # networks in the set(s) after the export
+    total: int = 0
+
+
+def decision_networks(decisions: Iterable[dict]) -> Set[Network]:
+    """Networks banned by decisions, in the flat or the grouped stream format.
+
+    In the grouped format, the decisions of a group are dicts ("new") or bare
+    values ("deleted"). Decisions without an IP or range value (e.g. country
+    scope) and decisions of another type than "ban" are skipped.
+    """
+    networks = set()
+    for decision in decisions:
+        if isinstance(decision, str):
+            value = decision
+        elif "decisions" in decision:
+            networks |= decision_networks(decision["decisions"] or [])
+            continue
+        elif decision.get("type", "ban") not in (None, "ban"):
+            continue
+        else:
+            value = decision.get("value") or decision.get("Value")
+        if not value:
+            continue
+        try:
+            networks.add(ipaddress.ip_network(value, strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+def collapse(networks: Iterable[Network]) -> List[Network]:
+    """Merge adjacent and overlapping networks, IPv4 first then IPv6, sorted"""
+    v4 = [n for n in networks if n.version == 4]
+    v6 = [n for n in networks if n.version == 6]
+    return list(ipaddress.collapse_addresses(v4)) + list(
+        ipaddress.collapse_addresses(v6)
+    )
+
+
+def write_networks(path: str, networks: Iterable[Network]):
+    """Write networks in the binary format, sorted for binary search"""
+    v4 = sorted(n for n in networks if n.version == 4)
+    v6 = sorted(n for n in networks if n.version == 6)
+    with _atomic_open(path) as f:
+        f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION, len(v4), len(v6)))
+        f.write(b"".join(n.network_address.packed + bytes((n.prefixlen,)) for n in v4))
+        f.write(b"".join(n.network_address.packed + bytes((n.prefixlen,)) for n in v6))
+
+
+def read_networks(path: str) -> List[Network]:
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, count4, count6 = _BINARY_HEADER.unpack_from(data)
+    if magic != _BINARY_MAGIC or version != _BINARY_VERSION:
+        raise ValueError(f"{path} is not a decision network list")
+    networks = []
+    offset = _BINARY_HEADER.size
+    for count, size, cls in (
+        (count4, 4, ipaddress.IPv4Network),
+        (count6, 16, ipaddress.IPv6Network),
+    ):
+        for _ in range(count):
+            address = data[offset : offset + size]
+            networks.append(cls((address, data[offset + size])))
+            offset += size + 1
+    return networks
+
+
+def export_decisions(
+    decisions: Union[dict, List[dict]],
+    path: str,
+    format: str = "nft",
+    state_path: Optional[str] = None,
+    full: bool = False,
+) -> ExportReport:
+    """Write the decisions to `path` in `format`.
+
+    `decisions` is either the response of `CAPIClient.get_decisions`, whose
+    "new" decisions are added to and "deleted" ones removed from the previous
+    export, or a list of all the active decisions. With a `state_path`, the
+    banned networks are kept there between exports and, unless `full` is set,
+    "nft" and "ipset" exports only delete and add what changed.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"unknown format {format!r}, expected one of {FORMATS}")
+    previous: Optional[Set[Network]] = None
+    if state_path and os.path.exists(state_path):
+        previous = set(read_networks(state_path))
+    if isinstance(decisions, dict):
+        new = decision_networks(decisions.get("new") or [])
+        deleted = decision_networks(decisions.get("deleted") or [])
+        current = ((previous or set()) - deleted) | new
+    else:
+        current = decision_networks(decisions)
+
+    exported = collapse(current)
+    if previous is None or full or format == "binary":
+        to_remove, to_add, flush = [], exported, True
+    else:
+        before = set(collapse(previous))
+        after = set(exported)
+        to_remove = sorted(before - after, key=_sort_key)
+        to_add = sorted(after - before, key=_sort_key)
+        flush = False
+
+    if format == "binary":
+        write_networks(path, exported)
+    else:
+        writer = _nft_lines if format == "nft" else _ipset_lines
+        with _atomic_open(path, "w") as f:
+            for line in writer(to_remove, to_add, flush):
+                f.write(line + "\n")
+
+    # the state is only saved once the export it describes is written
+    if state_path:
+        write_networks(state_path, current)
+    return ExportReport(added=len(to_add), removed=len(to_remove), total=len(exported))
+
+
+def _sort_key(network: Network) -> Tuple[int, Network]:
+    return network.version, network
+
+
+def _by_version(networks: List[Network]):
+    for version in (4, 6):
+        yield version, [str(n) for n in networks if n.version == version]
+
+
+def _nft_lines(to_remove: List[Network], to_add: List[Network], flush: bool):
+    if flush:
+        for name in SET_NAMES.values():
+            yield f"flush set {NFT_FAMILY} {NFT_TABLE} {name}"
+    # deletions first: a merged range would otherwise overlap its old parts
+    for action, networks in (("delete", to_remove), ("add", to_add)):
+        for version, elements in _by_version(networks):
+            for start in range(0, len(elements), _NFT_CHUNK):
+                chunk = ", ".join(elements[start : start + _NFT_CHUNK])
+                yield (
+                    f"{action} element {NFT_FAMILY} {NFT_TABLE} "
+                    f"{SET_NAMES[version]} {{ {chunk} }}"
+                )
+
+
+def _ipset_lines(to_remove: List[Network], to_add: List[Network], flush: bool):
+    for version, name in SET_NAMES.items():
+        family = "inet" if version == 4 else "inet6"
+        yield f"create {name} hash:net family {family} -exist"
+        if flush:
+            yield f"flush {name}"
+    for action, networks in (("del", to_remove), ("add", to_add)):
+        for version, elements in _by_version(networks):
+            for element in elements:
+                yield f"{action} {SET_NAMES[version]} {element} -exist"
+
+
+@contextmanager
+def _atomic_open(path: str, mode: str = "wb"):
+    # write to a temporary file and move it in place, so a firewall reload
+    # never reads a half-written file
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,200 @@
+"""
+Stream signals from NDJSON or CSV files into a storage.
+
+Each row needs `attacker_ip` (or `ip`), `scenario`, `created_at` and either a
+`machine_id` or a `machine_key` from which the machine id is derived with
+`generate_machine_id_from_key`.
+
+    cscapi-ingest signals.ndjson --db sqlite:///cscapi.db
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import IO, Dict, Iterable, Iterator, Optional
+
+from cscapi.storage import StorageInterface
+from cscapi.utils import (
+    batched,
+    create_signals,
+    generate_machine_id_from_key,
+    parse_timestamp,
+)
+
+logger = logging.getLogger("capi-py-sdk")
+
+FORMATS = ("ndjson", "csv")
+
+
+@dataclass
+class IngestReport:
+    rows: int = 0
+    # malformed rows, left out instead of aborting the file
+    rows_skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@lru_cache(maxsize=65536)
+def _machine_id_for_key(key: str, prefix: str) -> str:
+    # sha256 per row is a noticeable cost, and files usually hold few distinct keys
+    return generate_machine_id_from_key(key, prefix=prefix)
+
+
+def guess_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+
+def _open(path: str) -> IO[str]:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def iter_rows(stream: IO[str], format: str = "ndjson") -> Iterator[dict]:
+    if format == "csv":
+        yield from csv.DictReader(stream)
+    elif format == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # not a dict, ingest_rows counts it as skipped
+                yield None
+    else:
+        raise ValueError(f"unknown format {format!r}, expected one of {FORMATS}")
+
+
+def ingest_rows(
+    rows: Iterable[dict],
+    storage: StorageInterface,
+    chunk_size: int = 10000,
+    machine_id_prefix: str = "",
+) -> IngestReport:
+    """Store the rows' signals, `chunk_size` rows per write.
+
+    Rows without an IP, scenario or machine, or whose created_at can't be
+    parsed, are skipped and counted in `rows_skipped`.
+    """
+    report = IngestReport()
+    start = time.perf_counter()
+    for chunk in batched(rows, chunk_size):
+        ips, scenarios, created_ats, machine_ids = [], [], [], []
+        # rows usually share timestamps, only parse each distinct value once
+        parsed: Dict[str, datetime] = {}
+        for row in chunk:
+            try:
+                ip = row.get("attacker_ip") or row["ip"]
+                scenario = row["scenario"]
+                created_at = row["created_at"]
+                if created_at not in parsed:
+                    parsed[created_at] = parse_timestamp(created_at)
+                machine_id = row.get("machine_id") or _machine_id_for_key(
+                    row["machine_key"], machine_id_prefix
+                )
+                if not (ip and scenario and machine_id):
+                    raise ValueError("empty attacker_ip, scenario or machine")
+            except (
+                AttributeError,
+                KeyError,
+                TypeError,
+                ValueError,
+                OverflowError,
+            ) as e:
+                logger.debug(f"skipping row {row!r}: {e!r}")
+                report.rows_skipped += 1
+                continue
+            ips.append(ip)
+            scenarios.append(scenario)
+            created_ats.append(parsed[created_at])
+            machine_ids.append(machine_id)
+
+        storage.bulk_create_signals(
+            create_signals(ips, scenarios, created_ats, machine_ids)
+        )
+        report.rows += len(ips)
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            f"ingested {report.rows} rows ({report.rows_per_second:.0f} rows/s)"
+        )
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def ingest_file(
+    path: str,
+    storage: StorageInterface,
+    format: Optional[str] = None,
+    chunk_size: int = 10000,
+    machine_id_prefix: str = "",
+) -> IngestReport:
+    """Stream `path` into `storage`, holding at most `chunk_size` rows in memory"""
+    format = format or guess_format(path)
+    with _open(path) as stream:
+        return ingest_rows(
+            iter_rows(stream, format),
+            storage,
+            chunk_size=chunk_size,
+            machine_id_prefix=machine_id_prefix,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cscapi-ingest", description="Load signals from NDJSON/CSV files"
+    )
+    parser.add_argument("paths", nargs="+", help="files to ingest, '-' for stdin")
+    parser.add_argument("--db", default="sqlite:///cscapi.db")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--machine-id-prefix", default="")
+    parser.add_argument(
+        "--send", action="store_true", help="send signals to CAPI once ingested"
+    )
+    args = parser.parse_args(argv)
+
+    from cscapi.sql_storage import SQLStorage
+
+    storage = SQLStorage(args.db)
+    for path in args.paths:
+        report = ingest_file(
+            path,
+            storage,
+            format=args.format,
+            chunk_size=args.chunk_size,
+            machine_id_prefix=args.machine_id_prefix,
+        )
+        print(
+            f"{path}: {report.rows} rows in {report.seconds:.2f}s "
+            f"({report.rows_per_second:.0f} rows/s), "
+            f"{report.rows_skipped} malformed rows skipped"
+        )
+
+    if args.send:
+        from cscapi.client import CAPIClient
+
+        CAPIClient(storage).send_signals()
+
+
+if __name__ == "__main__":
+    main()
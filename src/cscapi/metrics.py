@@ -0,0 +1,160 @@
+"""
+Pluggable metrics for CAPIClient and SQLStorage.
+
+Metrics are reported through a `MetricsInterface`. The default `NoopMetrics`
+does nothing, adapters are provided for prometheus-client and OpenTelemetry.
+
+Reported metrics:
+
+- capi_requests_total (counter; endpoint, status)
+- capi_request_duration_seconds (histogram; endpoint, status)
+- signals_batch_size (histogram)
+- signals_batch_bytes (histogram)
+- signals_unsent (gauge)
+- decisions_cache_total (counter; result: hit or miss)
+- storage_operation_duration_seconds (histogram; operation)
+"""
+
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+Labels = Optional[Dict[str, str]]
+
+
+class MetricsInterface(ABC):
+    @abstractmethod
+    def increment(self, name: str, value: float = 1, labels: Labels = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: Labels = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def gauge(self, name: str, value: float, labels: Labels = None):
+        raise NotImplementedError
+
+    @contextmanager
+    def timer(self, name: str, labels: Labels = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+
+class NoopMetrics(MetricsInterface):
+    def increment(self, name: str, value: float = 1, labels: Labels = None):
+        pass
+
+    def observe(self, name: str, value: float, labels: Labels = None):
+        pass
+
+    def gauge(self, name: str, value: float, labels: Labels = None):
+        pass
+
+    def timer(self, name: str, labels: Labels = None):
+        return nullcontext()
+
+
+NOOP_METRICS = NoopMetrics()
+
+
+def timed_storage_operation(fn):
+    """Report the duration of a storage method to `self.metrics`"""
+    labels = {"operation": fn.__name__}
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.timer("storage_operation_duration_seconds", labels):
+            return fn(self, *args, **kwargs)
+
+    return wrapper
+
+
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+
+class PrometheusMetrics(MetricsInterface):
+    """Export metrics through prometheus-client (`pip install prometheus-client`)"""
+
+    def __init__(self, registry=None, namespace: str = "cscapi", buckets=None):
+        import prometheus_client
+
+        self._prometheus = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self.namespace = namespace
+        self.buckets = {
+            "signals_batch_size": SIZE_BUCKETS,
+            "signals_batch_bytes": BYTES_BUCKETS,
+        }
+        self.buckets.update(buckets or {})
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name: str, labels: Labels):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    kwargs = {}
+                    if kind is self._prometheus.Histogram and name in self.buckets:
+                        kwargs["buckets"] = self.buckets[name]
+                    metric = self._metrics[name] = kind(
+                        name,
+                        name.replace("_", " "),
+                        labelnames=sorted(labels or {}),
+                        namespace=self.namespace,
+                        registry=self.registry,
+                        **kwargs,
+                    )
+        return metric.labels(**labels) if labels else metric
+
+    def increment(self, name: str, value: float = 1, labels: Labels = None):
+        self._get(self._prometheus.Counter, name, labels).inc(value)
+
+    def observe(self, name: str, value: float, labels: Labels = None):
+        self._get(self._prometheus.Histogram, name, labels).observe(value)
+
+    def gauge(self, name: str, value: float, labels: Labels = None):
+        self._get(self._prometheus.Gauge, name, labels).set(value)
+
+
+class OpenTelemetryMetrics(MetricsInterface):
+    """Export metrics through the OpenTelemetry API (`pip install opentelemetry-api`)"""
+
+    def __init__(self, meter=None, prefix: str = "cscapi."):
+        if meter is None:
+            from opentelemetry import metrics
+
+            meter = metrics.get_meter("cscapi")
+        self.meter = meter
+        self.prefix = prefix
+        self._instruments = {}
+        self._lock = threading.Lock()
+
+    def _get(self, factory: str, name: str):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    instrument = self._instruments[name] = getattr(self.meter, factory)(
+                        f"{self.prefix}{name}"
+                    )
+        return instrument
+
+    def increment(self, name: str, value: float = 1, labels: Labels = None):
+        self._get("create_counter", name).add(value, attributes=labels)
+
+    def observe(self, name: str, value: float, labels: Labels = None):
+        self._get("create_histogram", name).record(value, attributes=labels)
+
+    def gauge(self, name: str, value: float, labels: Labels = None):
+        self._get("create_gauge", name).set(value, attributes=labels)
@@ -0,0 +1,278 @@
+"""
+A local stand-in for CAPI, to exercise CAPIClient under latency, errors and
+throttling without touching the real service.
+
+    with MockCAPI(latency=(0.01, 0.05), throttle_rate=0.01) as capi:
+        client = CAPIClient(storage, base_url=capi.base_url)
+        client.send_signals()
+        print(capi.signals_received, capi.requests)
+
+It implements registration, login (issuing signed JWTs that expire after
+`token_ttl` seconds), signals, the decision stream (with ETag support) and
+enrollment. Every request first waits `latency` seconds, then fails with a
+500 with probability `error_rate` or with a 429 with probability
+`throttle_rate`.
+
+    python -m cscapi.mock_capi --port 8080 --latency 0.02
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple, Union
+
+Latency = Union[float, Tuple[float, float]]
+
+ENDPOINTS = {
+    ("POST", "/v3/watchers"): "register",
+    ("POST", "/v3/watchers/login"): "login",
+    ("POST", "/v3/watchers/enroll"): "enroll",
+    ("POST", "/v3/signals"): "signals",
+    ("GET", "/v3/decisions/stream"): "decisions",
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't let Nagle's algorithm
+    # hold the body back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        capi: MockCAPI = self.server.capi
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        endpoint = ENDPOINTS.get((self.command, self.path.split("?")[0]))
+        if endpoint is None:
+            return self._reply(endpoint, 404, {"message": "not found"})
+
+        capi._sleep()
+        injected = capi._injected_failure()
+        if injected:
+            return self._reply(endpoint, injected, {"message": "injected"})
+
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            return self._reply(endpoint, 400, {"message": "invalid json"})
+
+        if endpoint == "register":
+            return self._reply(endpoint, *capi._register(payload))
+        if endpoint == "login":
+            return self._reply(endpoint, *capi._login(payload))
+
+        machine_id = capi._authenticate(self.headers.get("Authorization", ""))
+        if machine_id is None:
+            return self._reply(endpoint, 401, {"message": "invalid token"})
+        if endpoint == "signals":
+            return self._reply(endpoint, *capi._signals(payload))
+        if endpoint == "enroll":
+            return self._reply(endpoint, *capi._enroll(machine_id, payload))
+
+        etag = capi._decisions_etag
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(endpoint, 304, None)
+        return self._reply(endpoint, 200, capi.decisions, {"ETag": etag})
+
+    def _reply(self, endpoint: Optional[str], status: int, payload, headers=None):
+        with self.server.capi._lock:
+            self.server.capi.requests[(endpoint, status)] += 1
+        data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 makes clients with many workers wait for SYN
+    # retransmits, which would show up as one second of latency
+    request_queue_size = 1024
+
+
+class MockCAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Latency = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        token_ttl: float = 3600,
+        decisions: Optional[dict] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        `latency` is a number of seconds or a (min, max) range to draw from.
+        `port` 0 picks a free port, see `base_url`.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.token_ttl = token_ttl
+        self.decisions = decisions or {"new": [], "deleted": []}
+
+        self.secret = secrets.token_hex(32)
+        # machine_id -> password
+        self.machines = {}
+        # machine_id -> last enrollment payload
+        self.enrollments = {}
+        self.signals_received = 0
+        # (endpoint, status) -> number of responses
+        self.requests: Counter = Counter()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.server = _Server((host, port), _Handler)
+        self.server.capi = self
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def start(self) -> "MockCAPI":
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="cscapi-mock-capi", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "MockCAPI":
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    @property
+    def _decisions_etag(self) -> str:
+        data = json.dumps(self.decisions, sort_keys=True).encode()
+        return f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+
+    def _sleep(self):
+        latency = self.latency
+        if isinstance(latency, tuple):
+            with self._lock:
+                latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def _injected_failure(self) -> Optional[int]:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return 500
+        if roll < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def _register(self, payload):
+        if not payload or not payload.get("machine_id") or not payload.get("password"):
+            return 400, {"message": "machine_id and password are required"}
+        with self._lock:
+            known = self.machines.setdefault(payload["machine_id"], payload["password"])
+        if known != payload["password"]:
+            return 403, {"message": "machine already registered"}
+        return 200, {"message": "OK"}
+
+    def _login(self, payload):
+        import jwt
+
+        payload = payload or {}
+        machine_id = payload.get("machine_id")
+        with self._lock:
+            password = self.machines.get(machine_id)
+        if password is None or password != payload.get("password"):
+            return 403, {"message": "invalid machine_id or password"}
+        expire = int(time.time() + self.token_ttl)
+        token = jwt.encode(
+            {"sub": machine_id, "exp": expire, "iat": int(time.time())},
+            self.secret,
+            algorithm="HS256",
+        )
+        return 200, {"code": 200, "expire": expire, "token": token}
+
+    def _authenticate(self, authorization: str) -> Optional[str]:
+        import jwt
+
+        token = authorization.split(" ")[-1]
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=["HS256"])
+        except jwt.PyJWTError:
+            return None
+        return claims["sub"]
+
+    def _signals(self, payload):
+        if not isinstance(payload, list):
+            return 400, {"message": "expected a list of signals"}
+        with self._lock:
+            self.signals_received += len(payload)
+        return 200, "OK"
+
+    def _enroll(self, machine_id: str, payload):
+        if not payload or not payload.get("attachment_key"):
+            return 400, {"message": "attachment_key is required"}
+        with self._lock:
+            self.enrollments[machine_id] = payload
+        return 200, {"message": "OK"}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cscapi.mock_capi", description="Run a local mock CAPI"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=3600)
+    args = parser.parse_args(argv)
+
+    capi = MockCAPI(
+        args.host,
+        args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        token_ttl=args.token_ttl,
+    )
+    print(f"mock CAPI listening on {capi.base_url}")
+    try:
+        capi.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capi.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
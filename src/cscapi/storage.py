@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, fields
-from typing import List, Optional
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterator, List, Optional
 
 
 @dataclass
@@ -17,6 +17,8 @@ class MachineModel:
     token: Optional[str] = ""
     password: Optional[str] = ""
     scenarios: Optional[str] = ""
+    # fingerprint of the last successful enrollment, see CAPIClient.enroll_machines
+    enrollment: Optional[str] = ""
 
 
 @dataclass
@@ -84,6 +86,33 @@ class SignalModel:
                 setattr(self, k, v)
 
 
+@dataclass
+class StorageStats:
+    signals_unsent: int = 0
+    signals_sent: int = 0
+    unsent_by_machine: Dict[str, int] = field(default_factory=dict)
+    oldest_unsent_created_at: Optional[str] = None
+    machines: int = 0
+
+
+def _stats_from_signals(signals: List[SignalModel]) -> StorageStats:
+    stats = StorageStats()
+    for signal in signals:
+        if signal.sent:
+            stats.signals_sent += 1
+            continue
+        stats.signals_unsent += 1
+        stats.unsent_by_machine[signal.machine_id] = (
+            stats.unsent_by_machine.get(signal.machine_id, 0) + 1
+        )
+        if signal.created_at and (
+            stats.oldest_unsent_created_at is None
+            or signal.created_at < stats.oldest_unsent_created_at
+        ):
+            stats.oldest_unsent_created_at = signal.created_at
+    return stats
+
+
 class StorageInterface(ABC):
     @abstractmethod
     def get_all_signals(self) -> List[SignalModel]:
@@ -103,6 +132,88 @@ class StorageInterface(ABC):
         # returns true if created new row else false
         raise NotImplementedError
 
+    def bulk_create_signals(self, signals: List[SignalModel]):
+        # backends should override this with a single batched write
+        for signal in signals:
+            self.update_or_create_signal(signal)
+
+    def claim_signals(
+        self, limit: int, lease_seconds: float = 300
+    ) -> List[SignalModel]:
+        # Take up to `limit` unsent signals for `lease_seconds`, during which
+        # other workers calling claim_signals won't get them. This default
+        # does not coordinate workers, backends should override it.
+        return [signal for signal in self.get_all_signals() if not signal.sent][:limit]
+
+    def mark_signals_sent(self, signals: List[SignalModel]):
+        for signal in signals:
+            signal.sent = True
+            self.update_or_create_signal(signal)
+
+    def count_unsent_signals(self) -> int:
+        # backends should override this with a count that loads no signals
+        return sum(not signal.sent for signal in self.get_all_signals())
+
+    def stats(self) -> StorageStats:
+        # Backends should override this with aggregate queries. This default
+        # loads every signal and only counts the machines that have signals.
+        signals = self.get_all_signals()
+        stats = _stats_from_signals(signals)
+        for machine_id in {signal.machine_id for signal in signals}:
+            stats.machines += self.get_machine_by_id(machine_id) is not None
+        return stats
+
+    def iter_signals(
+        self, batch_size: int = 1000, after_alert_id: Optional[int] = None
+    ) -> Iterator[List[SignalModel]]:
+        # Signals by increasing alert_id, `batch_size` at a time, starting
+        # after `after_alert_id`. This default loads every signal at once,
+        # backends should override it with paginated reads.
+        signals = sorted(
+            (
+                signal
+                for signal in self.get_all_signals()
+                if after_alert_id is None or signal.alert_id > after_alert_id
+            ),
+            key=lambda signal: signal.alert_id,
+        )
+        for start in range(0, len(signals), batch_size):
+            yield signals[start : start + batch_size]
+
+    def iter_machines(
+        self, batch_size: int = 1000, after_machine_id: Optional[str] = None
+    ) -> Iterator[List[MachineModel]]:
+        # Machines by increasing machine_id, `batch_size` at a time, starting
+        # after `after_machine_id`. There is no way to list machines in this
+        # interface, so this default only finds the machines that have signals.
+        machine_ids = sorted(
+            {
+                signal.machine_id
+                for signal in self.get_all_signals()
+                if after_machine_id is None or signal.machine_id > after_machine_id
+            }
+        )
+        machines = [self.get_machine_by_id(machine_id) for machine_id in machine_ids]
+        machines = [machine for machine in machines if machine is not None]
+        for start in range(0, len(machines), batch_size):
+            yield machines[start : start + batch_size]
+
+    def bulk_update_or_create_machines(self, machines: List[MachineModel]):
+        # backends should override this with a single batched write
+        for machine in machines:
+            self.update_or_create_machine(machine)
+
+    def acquire_machine_lease(
+        self, machine_id: str, holder: str, lease_seconds: float
+    ) -> bool:
+        # Reserve the machine's login to `holder` for `lease_seconds`, unless
+        # another holder has an unexpired lease. This default does not
+        # coordinate processes, backends shared by several should override it.
+        return True
+
+    def release_machine_lease(self, machine_id: str, holder: str):
+        pass
+
     @abstractmethod
     def delete_signals(self, signals: List[SignalModel]):
         raise NotImplementedError
@@ -110,3 +221,71 @@ class StorageInterface(ABC):
     @abstractmethod
     def delete_machines(self, machines: List[MachineModel]):
         raise NotImplementedError
+
+
+class AsyncStorageInterface(ABC):
+    """StorageInterface for asyncio code, with the same methods as coroutines"""
+
+    @abstractmethod
+    async def get_all_signals(self) -> List[SignalModel]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_machine_by_id(self, machine_id: str) -> MachineModel:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_or_create_machine(self, machine: MachineModel) -> bool:
+        # returns true if created new row else false
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_or_create_signal(self, signal: SignalModel) -> bool:
+        # returns true if created new row else false
+        raise NotImplementedError
+
+    async def bulk_create_signals(self, signals: List[SignalModel]):
+        # backends should override this with a single batched write
+        for signal in signals:
+            await self.update_or_create_signal(signal)
+
+    async def claim_signals(
+        self, limit: int, lease_seconds: float = 300
+    ) -> List[SignalModel]:
+        # see StorageInterface.claim_signals
+        signals = await self.get_all_signals()
+        return [signal for signal in signals if not signal.sent][:limit]
+
+    async def mark_signals_sent(self, signals: List[SignalModel]):
+        for signal in signals:
+            signal.sent = True
+            await self.update_or_create_signal(signal)
+
+    async def count_unsent_signals(self) -> int:
+        signals = await self.get_all_signals()
+        return sum(not signal.sent for signal in signals)
+
+    async def stats(self) -> StorageStats:
+        # see StorageInterface.stats
+        signals = await self.get_all_signals()
+        stats = _stats_from_signals(signals)
+        for machine_id in {signal.machine_id for signal in signals}:
+            stats.machines += (await self.get_machine_by_id(machine_id)) is not None
+        return stats
+
+    async def acquire_machine_lease(
+        self, machine_id: str, holder: str, lease_seconds: float
+    ) -> bool:
+        # see StorageInterface.acquire_machine_lease
+        return True
+
+    async def release_machine_lease(self, machine_id: str, holder: str):
+        pass
+
+    @abstractmethod
+    async def delete_signals(self, signals: List[SignalModel]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_machines(self, machines: List[MachineModel]):
+        raise NotImplementedError
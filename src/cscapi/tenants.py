@@ -0,0 +1,156 @@
+"""
+Many tenants, each with its own storage, sharing one CAPI connection pool.
+
+    pool = TenantPool(max_connections=50, http2=True)
+    pool.add_tenant("customer-a", SQLStorage("sqlite:///a.db"))
+    pool.add_tenant("customer-b", SQLStorage("sqlite:///b.db"))
+    report = pool.flush()
+
+Each tenant gets a regular CAPIClient using the pool's `httpx.Client`, so
+connections and TLS sessions to CAPI are reused across tenants.
+"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, fields
+from typing import Dict, Optional
+
+from cscapi.breaker import CircuitBreaker
+from cscapi.client import CAPIClient, SendReport, make_http_client
+from cscapi.storage import StorageInterface
+
+logger = logging.getLogger("capi-py-sdk")
+
+
+@dataclass
+class TenantFlushReport:
+    reports: Dict[str, SendReport] = field(default_factory=dict)
+    # tenant_id -> error of the turn that failed, the tenant is not retried
+    # during the same flush
+    failures: Dict[str, str] = field(default_factory=dict)
+    # turns taken, a tenant with a big backlog takes several
+    turns: int = 0
+
+    @property
+    def signals_sent(self) -> int:
+        return sum(report.signals_sent for report in self.reports.values())
+
+
+class TenantPool:
+    def __init__(
+        self,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 30.0,
+        http2: bool = False,
+        max_workers: int = 8,
+        http_client=None,
+    ):
+        """
+        Pool limits, keep-alive and `http2` configure the shared httpx.Client,
+        unless one is given as `http_client`. `max_workers` tenants flush at
+        the same time.
+        """
+        self.http_client = http_client or make_http_client(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            http2=http2,
+        )
+        self.max_workers = max_workers
+        # the tenants talk to the same CAPI, an outage opens the circuit for all
+        self.circuit_breaker = CircuitBreaker()
+        self.clients: Dict[str, CAPIClient] = {}
+        # rotates which tenant goes first from one flush to the next
+        self._rotation = 0
+
+    def add_tenant(
+        self, tenant_id: str, storage: StorageInterface, **client_kwargs
+    ) -> CAPIClient:
+        """Create the tenant's CAPIClient, `client_kwargs` go to CAPIClient"""
+        if tenant_id in self.clients:
+            raise ValueError(f"tenant {tenant_id!r} already exists")
+        client_kwargs.setdefault("circuit_breaker", self.circuit_breaker)
+        client = CAPIClient(storage, http_client=self.http_client, **client_kwargs)
+        self.clients[tenant_id] = client
+        return client
+
+    def remove_tenant(self, tenant_id: str) -> CAPIClient:
+        return self.clients.pop(tenant_id)
+
+    def flush(
+        self,
+        signals_per_turn: int = 1000,
+        deadline: Optional[float] = None,
+        **send_kwargs,
+    ) -> TenantFlushReport:
+        """Send the unsent signals of every tenant, round-robin.
+
+        A turn sends at most `signals_per_turn` signals of one tenant, then
+        the tenant goes to the back of the queue if it has more. A big
+        backlog therefore can't hold the pool while other tenants wait. No
+        new turn starts after `deadline` seconds. `send_kwargs` are passed to
+        `CAPIClient.send_signals`.
+        """
+        start = time.monotonic()
+        report = TenantFlushReport()
+        tenant_ids = list(self.clients)
+        if tenant_ids:
+            first = self._rotation % len(tenant_ids)
+            self._rotation += 1
+            tenant_ids = tenant_ids[first:] + tenant_ids[:first]
+        queue = deque(tenant_ids)
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            # one turn per tenant at a time, so a storage is never used
+            # by two threads at once
+            running = {}
+            while queue or running:
+                expired = deadline is not None and time.monotonic() - start >= deadline
+                while queue and len(running) < self.max_workers and not expired:
+                    tenant_id = queue.popleft()
+                    future = executor.submit(
+                        self.clients[tenant_id].send_signals,
+                        max_signals=signals_per_turn,
+                        **send_kwargs,
+                    )
+                    running[future] = tenant_id
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tenant_id = running.pop(future)
+                    report.turns += 1
+                    try:
+                        turn = future.result()
+                    except Exception as e:
+                        logger.exception(f"Error while flushing tenant {tenant_id}")
+                        report.failures[tenant_id] = str(e)
+                        continue
+                    report.reports[tenant_id] = _add_reports(
+                        report.reports.get(tenant_id), turn
+                    )
+                    if turn.stopped_by == "max_signals" and turn.signals_remaining:
+                        queue.append(tenant_id)
+        return report
+
+    def close(self):
+        self.http_client.close()
+
+
+def _add_reports(total: Optional[SendReport], turn: SendReport) -> SendReport:
+    if total is None:
+        return turn
+    for report_field in fields(SendReport):
+        value = getattr(turn, report_field.name)
+        if isinstance(value, int):
+            setattr(total, report_field.name, getattr(total, report_field.name) + value)
+    for phase, seconds in turn.durations.items():
+        total.durations[phase] = total.durations.get(phase, 0.0) + seconds
+    # these describe where the tenant stands after its last turn
+    total.stopped_by = turn.stopped_by
+    total.signals_remaining = turn.signals_remaining
+    return total
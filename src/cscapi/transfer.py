@@ -0,0 +1,148 @@
+"""
+Copy machines and signals from one storage to another, e.g. when moving from
+SQLite to PostgreSQL.
+
+    cscapi-copy sqlite:///cscapi.db postgresql://user:pass@db/cscapi \\
+        --checkpoint copy.checkpoint
+
+Machines keep their password, token, scenarios and enrollment. Signals keep
+their sent flag but get new alert and decision ids from the destination, and
+their claims are not copied. Both are read and written in batches of `batch_size`, by
+increasing machine_id then alert_id.
+
+With a checkpoint file, the position of the copy is saved after each batch
+and an interrupted copy resumes where it stopped. Machines are upserted, so
+copying them again is harmless; a batch of signals is copied twice only if
+the process is killed between writing it and saving the checkpoint.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Optional
+
+from cscapi.storage import SignalModel, StorageInterface
+
+logger = logging.getLogger("capi-py-sdk")
+
+
+@dataclass
+class CopyReport:
+    machines: int = 0
+    signals: int = 0
+    seconds: float = 0.0
+    # last copied machine_id and source alert_id, where a resumed copy starts
+    last_machine_id: Optional[str] = None
+    last_alert_id: Optional[int] = None
+
+    @property
+    def signals_per_second(self) -> float:
+        return self.signals / self.seconds if self.seconds else 0.0
+
+
+def copy_storage(
+    src: StorageInterface,
+    dst: StorageInterface,
+    batch_size: int = 5000,
+    checkpoint_path: Optional[str] = None,
+    progress: Optional[Callable[[CopyReport], None]] = None,
+) -> CopyReport:
+    """Copy every machine then every signal of `src` into `dst`.
+
+    `progress` is called with the report after each batch. With a
+    `checkpoint_path`, the copy resumes from the position saved there and the
+    counts of the report include the batches copied before.
+    """
+    report = CopyReport()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            report = CopyReport(**json.load(f))
+        logger.info(
+            f"Resuming copy after machine {report.last_machine_id!r} "
+            f"and signal {report.last_alert_id}"
+        )
+
+    start = time.perf_counter() - report.seconds
+
+    def batch_done():
+        report.seconds = time.perf_counter() - start
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, report)
+        if progress:
+            progress(report)
+
+    for machines in src.iter_machines(batch_size, report.last_machine_id):
+        dst.bulk_update_or_create_machines(machines)
+        report.machines += len(machines)
+        report.last_machine_id = machines[-1].machine_id
+        batch_done()
+
+    for signals in src.iter_signals(batch_size, report.last_alert_id):
+        dst.bulk_create_signals([_unsaved(signal) for signal in signals])
+        report.signals += len(signals)
+        report.last_alert_id = signals[-1].alert_id
+        batch_done()
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _unsaved(signal: SignalModel) -> SignalModel:
+    # the destination assigns its own ids, source ones may already be taken
+    return replace(
+        signal,
+        alert_id=None,
+        decisions=[replace(d, id=None) for d in signal.decisions or []],
+    )
+
+
+def _save_checkpoint(path: str, report: CopyReport):
+    # written to the side and moved in place, a crash leaves the previous one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(asdict(report), f)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cscapi-copy", description="Copy machines and signals between databases"
+    )
+    parser.add_argument("src", help="connection string to copy from")
+    parser.add_argument("dst", help="connection string to copy to")
+    parser.add_argument(
+        "--src-schema", choices=("normalized", "json"), default="normalized"
+    )
+    parser.add_argument(
+        "--dst-schema", choices=("normalized", "json"), default="normalized"
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--checkpoint", help="file to resume an interrupted copy")
+    args = parser.parse_args(argv)
+
+    from cscapi.sql_storage import SQLStorage
+
+    src = SQLStorage(args.src, schema=args.src_schema)
+    dst = SQLStorage(args.dst, schema=args.dst_schema)
+
+    def progress(report: CopyReport):
+        print(
+            f"{report.machines} machines, {report.signals} signals "
+            f"in {report.seconds:.2f}s ({report.signals_per_second:.0f} signals/s)"
+        )
+
+    report = copy_storage(
+        src,
+        dst,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        progress=progress,
+    )
+    print(f"done: {report.machines} machines, {report.signals} signals")
+
+
+if __name__ == "__main__":
+    main()
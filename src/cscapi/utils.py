@@ -1,12 +1,30 @@
 import hashlib
+import os
+import re
 import uuid
-from datetime import timezone
-
-from dacite import from_dict
-from dateutil import parser as datetimeparser
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 from cscapi.storage import SignalModel, SourceModel
 
+SIGNAL_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+Timestamp = Union[str, int, float, datetime]
+
+# epoch seconds in text inputs, e.g. CSV columns; from 9 digits (1973) on,
+# so that basic ISO-8601 dates such as "20201128" are still read as dates
+_EPOCH_RE = re.compile(r"\d{9,}(\.\d*)?")
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[tuple]:
+    """Yield successive tuples of at most `size` items"""
+    iterator = iter(iterable)
+    while batch := tuple(islice(iterator, size)):
+        yield batch
+
 
 def generate_machine_id_from_key(key, prefix: str = "", length=48) -> str:
     """Generate a deterministic machine id based on the input key and prefix"""
@@ -25,14 +43,44 @@ def generate_machine_id_from_key(key, prefix: str = "", length=48) -> str:
     return machine_id
 
 
+def parse_timestamp(value: Timestamp) -> datetime:
+    """Parse an ISO-8601 string, epoch number or datetime into a datetime.
+
+    Epoch numbers, also as strings such as "1700000000.5", and ISO-8601
+    strings are handled by the standard library, anything else falls back to
+    dateutil.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if _EPOCH_RE.fullmatch(value):
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    try:
+        # Python < 3.11 does not understand the "Z" suffix
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+    except ValueError:
+        # dateutil is only imported when the fast path fails
+        from dateutil import parser as datetimeparser
+
+        return datetimeparser.parse(value)
+
+
+def format_timestamp(value: Timestamp) -> str:
+    """Convert a timestamp to the UTC string format expected by CAPI"""
+    return (
+        parse_timestamp(value).astimezone(timezone.utc).strftime(SIGNAL_DATETIME_FORMAT)
+    )
+
+
 def create_signal(
-    attacker_ip: str, scenario: str, created_at: str, machine_id: str, **kwargs
+    attacker_ip: str, scenario: str, created_at: Timestamp, machine_id: str, **kwargs
 ) -> SignalModel:
-    created_at = (
-        datetimeparser.parse(created_at)
-        .astimezone(timezone.utc)
-        .strftime("%Y-%m-%dT%H:%M:%S%z")
-    )
+    from dacite import from_dict
+
+    created_at = format_timestamp(created_at)
 
     if "start_at" not in kwargs:
         kwargs["start_at"] = created_at
@@ -46,19 +94,137 @@ def create_signal(
     if "uuid" not in kwargs:
         kwargs["uuid"] = str(uuid.uuid4())
 
-    kwargs["source"] = {"ip": ip, "scope": "ip"}
+    kwargs["source"] = {"ip": attacker_ip, "scope": "ip"}
     kwargs["scenario"] = scenario
     kwargs["created_at"] = created_at
     kwargs["machine_id"] = machine_id
 
     return from_dict(SignalModel, kwargs)
-    # return SignalModel(
-    #     created_at=created_at,
-    #     machine_id=machine_id,
-    #     source=SourceModel(
-    #         ip=ip,
-    #         scope="ip"
-    #     ),
-    #     scenario=scenario,
-    #     **kwargs  # Place **kwargs inside the parentheses
-    # )
+
+
+def _bulk_uuid4(count: int) -> List[str]:
+    # A single urandom call is much cheaper than calling uuid.uuid4() per signal
+    entropy = os.urandom(16 * count)
+    return [
+        str(uuid.UUID(bytes=entropy[i : i + 16], version=4))
+        for i in range(0, 16 * count, 16)
+    ]
+
+
+def create_signals(
+    attacker_ips: Sequence[str],
+    scenarios: Union[str, Sequence[str]],
+    created_ats: Sequence[Timestamp],
+    machine_ids: Union[str, Sequence[str]],
+    **kwargs,
+) -> List[SignalModel]:
+    """Build many signals at once from columnar inputs.
+
+    `attacker_ips`, `scenarios`, `created_ats` and `machine_ids` are parallel
+    sequences; `scenarios` and `machine_ids` may also be a single string shared
+    by every signal. Extra keyword arguments are applied to every signal.
+    """
+    count = len(attacker_ips)
+    if isinstance(scenarios, str):
+        scenarios = [scenarios] * count
+    if isinstance(machine_ids, str):
+        machine_ids = [machine_ids] * count
+    if not (len(scenarios) == len(created_ats) == len(machine_ids) == count):
+        raise ValueError(
+            "attacker_ips, scenarios, created_ats and machine_ids differ in length"
+        )
+
+    defaults = {"context": None, "decisions": None, "scenario_trust": "manual"}
+    defaults.update(kwargs)
+
+    # Log lines usually share timestamps, only convert each distinct value once
+    formatted: Dict[Timestamp, str] = {}
+    signals = []
+    for ip, scenario, created_at, machine_id, signal_uuid in zip(
+        attacker_ips, scenarios, created_ats, machine_ids, _bulk_uuid4(count)
+    ):
+        timestamp: Optional[str] = formatted.get(created_at)
+        if timestamp is None:
+            timestamp = formatted[created_at] = format_timestamp(created_at)
+        signals.append(
+            SignalModel(
+                **{
+                    "start_at": timestamp,
+                    "stop_at": timestamp,
+                    **defaults,
+                    "created_at": timestamp,
+                    "machine_id": machine_id,
+                    "source": SourceModel(ip=ip, scope="ip"),
+                    "uuid": signal_uuid,
+                    "scenario": scenario,
+                }
+            )
+        )
+    return signals
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parse_timestamp(value).timestamp()
+    except (ValueError, OverflowError):
+        return None
+
+
+def _merge(signals: List[SignalModel]) -> SignalModel:
+    if len(signals) == 1:
+        return signals[0]
+
+    starts = [(_epoch(s.start_at) or _epoch(s.created_at), s.start_at) for s in signals]
+    stops = [(_epoch(s.stop_at) or _epoch(s.created_at), s.stop_at) for s in signals]
+
+    context, seen_context = [], set()
+    decisions: Dict[Tuple, object] = {}
+    for signal in signals:
+        for ctx in signal.context or []:
+            if (ctx.key, ctx.value) not in seen_context:
+                seen_context.add((ctx.key, ctx.value))
+                context.append(ctx)
+        for decision in signal.decisions or []:
+            # the most recent decision wins for a given target
+            decisions[(decision.type, decision.scope, decision.value)] = decision
+
+    return replace(
+        signals[0],
+        start_at=min(starts, key=lambda start: start[0])[1],
+        stop_at=max(stops, key=lambda stop: stop[0])[1],
+        context=context or signals[0].context,
+        decisions=list(decisions.values()) or signals[0].decisions,
+    )
+
+
+def aggregate_signals(signals: List[SignalModel], window: float) -> List[SignalModel]:
+    """Collapse signals sharing machine_id, source ip and scenario.
+
+    Signals whose start falls within `window` seconds of the first signal of a
+    group are merged into one: start_at/stop_at are widened to cover all of
+    them and their context and decisions are combined. Signals without a
+    parseable timestamp are kept as is. Input signals are not modified.
+    """
+    groups: Dict[Tuple, List[Tuple[float, SignalModel]]] = defaultdict(list)
+    aggregated = []
+    for signal in signals:
+        start = _epoch(signal.start_at) or _epoch(signal.created_at)
+        ip = signal.source.ip if signal.source else None
+        if start is None or not ip:
+            aggregated.append(signal)
+            continue
+        groups[(signal.machine_id, ip, signal.scenario)].append((start, signal))
+
+    for group in groups.values():
+        group.sort(key=lambda item: item[0])
+        window_start, current = group[0][0], []
+        for start, signal in group:
+            if start - window_start > window:
+                aggregated.append(_merge(current))
+                window_start, current = start, []
+            current.append(signal)
+        aggregated.append(_merge(current))
+
+    return aggregated
@@ -0,0 +1,51 @@
+import pytest
+
+from cscapi.breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10, clock=Clock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_half_open_probe():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+
+    assert breaker.state == "half_open"
+    breaker.before_request()
+    # only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now = 15
+    assert breaker.state == "open"
+
+    clock.now = 20
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
@@ -2,9 +2,9 @@
 
 Send Signals
 1. Send signals from fresh state. Assert machine creation, token creation, correct scenarios etc.
-2. Send signals except the machines are already in the DB. Assert no new registrations 
+2. Send signals except the machines are already in the DB. Assert no new registrations
 3. Send signals except the machines are already in the DB but tokens are stale. Assert new tokens are created
-4. Send signals except some machines are fresh, some have stale token, some are good to send. 
+4. Send signals except some machines are fresh, some have stale token, some are good to send.
 
 Get decisions
 1. Get decisions from fresh machine
@@ -23,6 +23,7 @@ import json
 import os
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, replace
 
 import httpx
@@ -31,6 +32,7 @@ import pytest
 from dacite import from_dict
 from pytest_httpx import HTTPXMock
 
+from cscapi.breaker import CircuitBreaker, CircuitOpenError
 from cscapi.client import (
     CAPI_DECISIONS_URL,
     CAPI_ENROLL_URL,
@@ -38,6 +40,7 @@ from cscapi.client import (
     CAPI_WATCHER_LOGIN_URL,
     CAPI_WATCHER_REGISTER_URL,
     CAPIClient,
+    machine_token_is_valid,
 )
 from cscapi.sql_storage import SQLStorage
 from cscapi.storage import MachineModel, SignalModel
@@ -296,6 +299,285 @@ class TestSendSignals:
 
         assert client.storage.get_machine_by_id(fresh_mid) is not None
 
+    def test_send_signals_report(self, httpx_mock: HTTPXMock, client: CAPIClient):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        client.add_signals(
+            [mock_signals()[0], replace(mock_signals()[0], machine_id="test1")]
+        )
+        client._make_machine(MachineModel("test1"))
+
+        report = client.send_signals(prune_after_send=True)
+
+        assert report.signals_read == 2
+        assert report.signals_sent == 2
+        assert report.signals_pruned == 2
+        assert report.machines_registered == 1
+        assert report.machines_logged_in == 0
+        assert report.machines_cached == 1
+        assert report.batches == 2
+        assert report.bytes_uploaded == sum(
+            len(request.content)
+            for request in httpx_mock.get_requests()
+            if request.url == CAPI_SIGNALS_URL
+        )
+        assert set(report.durations) == {
+            "storage_read",
+            "grouping",
+            "auth",
+            "upload",
+            "mark_sent",
+            "prune",
+        }
+        assert report.total_seconds > 0
+        assert client.storage.get_all_signals() == []
+
+    def test_send_signals_with_aggregation(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        signals = unsaved_signals(5)
+        client.add_signals(signals)
+
+        report = client.send_signals(aggregation_window=60)
+
+        assert report.signals_read == 5
+        assert report.signals_uploaded == 1
+        [upload] = [
+            request
+            for request in httpx_mock.get_requests()
+            if request.url == CAPI_SIGNALS_URL
+        ]
+        assert len(json.loads(upload.content)) == 1
+        assert all(signal.sent for signal in client.storage.get_all_signals())
+
+    def test_send_signals_with_claims(self, httpx_mock: HTTPXMock, client: CAPIClient):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        signals = unsaved_signals(3)
+        client.add_signals(signals)
+
+        assert client.send_signals(claim_limit=2).signals_sent == 2
+        assert client.send_signals(claim_limit=2).signals_sent == 1
+        assert client.send_signals(claim_limit=2).signals_sent == 0
+        assert all(signal.sent for signal in client.storage.get_all_signals())
+
+    def test_send_signals_batches_by_size(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        signals = unsaved_signals(10)
+        for i, signal in enumerate(signals):
+            signal.message = "x" * (5000 if i == 0 else 10)
+        client.add_signals(signals)
+        item_size = len(json.dumps(asdict(signals[1])).encode())
+        client.max_batch_bytes = 3 * item_size + 4
+        client.max_batch_size = 2
+
+        report = client.send_signals()
+
+        uploads = [
+            json.loads(request.content)
+            for request in httpx_mock.get_requests()
+            if request.url == CAPI_SIGNALS_URL
+        ]
+        # the oversized signal goes alone, the others are capped at 2 per batch
+        assert [len(upload) for upload in uploads] == [1, 2, 2, 2, 2, 1]
+        assert report.batches == 6
+        assert sum(len(upload) for upload in uploads) == 10
+
+    def test_add_signals_updates_stored_signals(self, client: CAPIClient):
+        client.add_signals(unsaved_signals(2))
+        stored = client.storage.get_all_signals()
+        for signal in stored:
+            signal.message = "updated"
+
+        client.add_signals(stored + unsaved_signals(1))
+
+        signals = client.storage.get_all_signals()
+        assert len(signals) == 3
+        assert sorted(s.message for s in signals)[1:] == ["updated", "updated"]
+
+    def test_signal_batches_stay_under_byte_budget(self, client: CAPIClient):
+        # random decision ids would make the signals differ in size
+        signals = unsaved_signals(20)
+        item_size = len(json.dumps(asdict(signals[0])).encode())
+        client.max_batch_bytes = 3 * item_size + 4
+
+        batches = list(client._signal_batches(signals))
+
+        assert [count for count, _ in batches] == [3] * 6 + [2]
+        for count, body in batches:
+            assert len(body) <= client.max_batch_bytes
+            assert len(json.loads(body)) == count
+
+    def _add_drain_signals(self, httpx_mock: HTTPXMock, client: CAPIClient, count):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        signals = unsaved_signals(count)
+        client.add_signals(signals)
+
+    def test_send_signals_drains_up_to_max_signals(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        self._add_drain_signals(httpx_mock, client, 5)
+
+        report = client.send_signals(max_signals=3, claim_limit=2)
+
+        assert report.signals_sent == 3
+        assert report.stopped_by == "max_signals"
+        assert report.signals_remaining == 2
+        # chunks of 2 then 1 signals, the machine is only registered once
+        assert report.batches == 2
+        assert report.machines_registered == 1
+        assert report.machines_cached == 1
+
+        report = client.send_signals(max_signals=10)
+
+        assert report.signals_sent == 2
+        assert report.stopped_by is None
+        assert report.signals_remaining == 0
+
+    def test_send_signals_stops_at_deadline(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        self._add_drain_signals(httpx_mock, client, 3)
+
+        report = client.send_signals(deadline=0, claim_limit=1)
+
+        assert report.signals_sent == 1
+        assert report.stopped_by == "deadline"
+        assert report.signals_remaining == 2
+
+    def test_send_signals_stops_at_max_memory(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        self._add_drain_signals(httpx_mock, client, 3)
+
+        report = client.send_signals(max_memory=1, claim_limit=2)
+
+        assert report.signals_sent == 2
+        assert report.stopped_by == "max_memory"
+        assert report.signals_remaining == 1
+
+    def test_send_signals_spools_while_circuit_is_open(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, status_code=503
+        )
+        client.circuit_breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+        signals = unsaved_signals(2)
+        client.add_signals(signals)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            client.send_signals()
+        report = client.send_signals()
+
+        assert report.stopped_by == "circuit_open"
+        assert report.signals_sent == 0
+        assert len(httpx_mock.get_requests()) == 1
+        assert client.storage.count_unsent_signals() == 2
+        with pytest.raises(CircuitOpenError):
+            client.get_decisions("test", ["crowdsecurity/http-bf"])
+        assert len(httpx_mock.get_requests()) == 1
+
+
+class TestWarmMachines:
+    def test_warm_machines_before_first_send(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+        client._make_machine(MachineModel("good"))
+        client.storage.update_or_create_machine(
+            MachineModel("expiring", dummy_token(exp=int(time.time()) + 60), "pwd")
+        )
+        assert len(httpx_mock.get_requests()) == 2
+
+        report = client.warm_machines(
+            ["test", "test1", "good", "expiring", "test"], ["crowdsecurity/ssh-bf"]
+        )
+
+        assert report.machines_registered == 2
+        assert report.machines_logged_in == 1
+        assert report.machines_cached == 1
+        assert report.failures == {}
+        assert len(httpx_mock.get_requests()) == 2 + 2 * 2 + 1
+        for machine_id in ("test", "test1"):
+            machine = client.storage.get_machine_by_id(machine_id)
+            assert machine_token_is_valid(machine.token)
+            assert machine.scenarios == "crowdsecurity/ssh-bf"
+
+        client.add_signals(mock_signals())
+        report = client.send_signals()
+        assert report.machines_cached == 1
+        assert report.durations["auth"] < 0.1
+        assert httpx_mock.get_requests()[-1].url == CAPI_SIGNALS_URL
+        assert len(httpx_mock.get_requests()) == 2 + 2 * 2 + 1 + 1
+
+    def test_warm_machines_reports_failures(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, status_code=401
+        )
+
+        report = client.warm_machines(["test"], ["crowdsecurity/ssh-bf"])
+
+        assert report.machines_registered == 0
+        assert "401" in report.failures["test"]
+        # the password is kept so a later login can still succeed
+        assert client.storage.get_machine_by_id("test").password
+
+    def test_rejected_registration_is_not_stored(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, status_code=429
+        )
+
+        report = client.warm_machines(["test"], ["crowdsecurity/ssh-bf"])
+
+        assert "429" in report.failures["test"]
+        assert client.storage.get_machine_by_id("test") is None
+        assert len(httpx_mock.get_requests()) == 1
+
 
 class TestGetDecisions:
     def test_get_decisions_from_fresh_machine(
@@ -384,6 +666,35 @@ class TestGetDecisions:
         client.get_decisions("test", ["crowdsecurity/http-bf"])
         assert len(httpx_mock.get_requests()) == 4
 
+    def test_get_decisions_uses_conditional_requests(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        client.storage.update_or_create_machine(
+            MachineModel("test", token=dummy_token(), password="pass")
+        )
+        body = {"new": [asdict(mock_signals()[0].decisions[0])], "deleted": []}
+        httpx_mock.add_response(
+            method="GET",
+            url=CAPI_DECISIONS_URL,
+            json=body,
+            headers={"ETag": '"v1"', "Last-Modified": "Mon, 19 Oct 2026 10:00:00 GMT"},
+        )
+        httpx_mock.add_response(method="GET", url=CAPI_DECISIONS_URL, status_code=304)
+
+        first = client.get_decisions("test", ["crowdsecurity/http-bf"])
+        second = client.get_decisions("test", ["crowdsecurity/http-bf"])
+
+        assert first == body
+        assert second is first
+        first_request, second_request = httpx_mock.get_requests()
+        assert "If-None-Match" not in first_request.headers
+        assert second_request.headers["If-None-Match"] == '"v1"'
+        assert (
+            second_request.headers["If-Modified-Since"]
+            == "Mon, 19 Oct 2026 10:00:00 GMT"
+        )
+        assert (client.decisions_cache_hits, client.decisions_cache_misses) == (1, 1)
+
 
 class TestEnroll:
     def test_enroll_from_fresh_machines(
@@ -402,20 +713,100 @@ class TestEnroll:
         assert client.storage.get_machine_by_id("test") is None
         assert client.storage.get_machine_by_id("test1") is None
 
-        client.enroll_machines(
+        results = client.enroll_machines(
             ["test", "test1"],
             ["crowdsecurity/http-bf"],
             attachment_key="toto",
             tags=["toto"],
         )
 
+        assert [(r.machine_id, r.status) for r in results] == [
+            ("test", "enrolled"),
+            ("test1", "enrolled"),
+        ]
+
         requests = httpx_mock.get_requests()
 
         assert len(requests) == 6  # For each machine, 1 register, 1 login, 1 enroll
 
-        assert requests[0].url == CAPI_WATCHER_REGISTER_URL
-        assert requests[1].url == CAPI_WATCHER_LOGIN_URL
-        assert requests[2].url == CAPI_ENROLL_URL
+        # machines are handled concurrently: registrations, then logins, then enrollments
+        assert [r.url for r in requests[:2]] == [CAPI_WATCHER_REGISTER_URL] * 2
+        assert [r.url for r in requests[2:4]] == [CAPI_WATCHER_LOGIN_URL] * 2
+        assert [r.url for r in requests[4:]] == [CAPI_ENROLL_URL] * 2
+        for request in requests[4:]:
+            assert machine_token_is_valid(request.headers["Authorization"])
+
+    def test_enroll_repeated_machine_once(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_ENROLL_URL, json={"message": "OK"}
+        )
+
+        results = client.enroll_machines(
+            ["test", "test"], "name", attachment_key="toto", tags=["toto"]
+        )
+
+        assert [(r.machine_id, r.status) for r in results] == [
+            ("test", "enrolled"),
+            ("test", "enrolled"),
+        ]
+        assert [r.url for r in httpx_mock.get_requests()] == [
+            CAPI_WATCHER_REGISTER_URL,
+            CAPI_WATCHER_LOGIN_URL,
+            CAPI_ENROLL_URL,
+        ]
+
+    def test_enroll_skips_already_enrolled_machines(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_ENROLL_URL, json={"message": "OK"}
+        )
+
+        client.enroll_machines(["test"], "name", attachment_key="key", tags=["a"])
+        assert len(httpx_mock.get_requests()) == 3
+
+        results = client.enroll_machines(
+            ["test"], "name", attachment_key="key", tags=["a"]
+        )
+        assert results[0].status == "skipped"
+        assert len(httpx_mock.get_requests()) == 3
+
+        results = client.enroll_machines(
+            ["test"], "name", attachment_key="key", tags=["a", "b"]
+        )
+        assert results[0].status == "enrolled"
+        assert len(httpx_mock.get_requests()) == 4
+
+    def test_enroll_reports_failures(self, httpx_mock: HTTPXMock, client: CAPIClient):
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+        )
+        httpx_mock.add_response(method="POST", url=CAPI_ENROLL_URL, status_code=403)
+
+        [result] = client.enroll_machines(
+            ["test"], "name", attachment_key="key", tags=[]
+        )
+
+        assert result.status == "failed"
+        assert "403" in result.error
+        assert client.storage.get_machine_by_id("test").enrollment == ""
 
     def test_enroll_from_registered_machine_with_valid_token(
         self, httpx_mock: HTTPXMock, client: CAPIClient
@@ -474,6 +865,71 @@ class TestEnroll:
         assert len(requests) == 4
 
 
+class TestLoginSingleFlight:
+    def test_workers_reuse_the_token_of_the_one_logging_in(
+        self, httpx_mock: HTTPXMock, storage: SQLStorage
+    ):
+        storage.update_or_create_machine(
+            MachineModel("test", dummy_token(exp=1), "pass", "crowdsecurity/http-bf")
+        )
+        token = dummy_token()
+
+        def login(request: httpx.Request):
+            time.sleep(0.3)
+            return httpx.Response(status_code=200, json={"token": token})
+
+        httpx_mock.add_callback(login, url=CAPI_WATCHER_LOGIN_URL)
+
+        # separate storages on the same database, as worker processes would have
+        workers = [
+            CAPIClient(SQLStorage(f"sqlite:///{storage.session.bind.url.database}"))
+            for _ in range(4)
+        ]
+        with ThreadPoolExecutor(len(workers)) as pool:
+            machines = list(
+                pool.map(
+                    lambda worker: worker._refresh_machine_token(
+                        worker.storage.get_machine_by_id("test")
+                    ),
+                    workers,
+                )
+            )
+
+        assert len(httpx_mock.get_requests()) == 1
+        assert {machine.token for machine in machines} == {token}
+        assert storage.get_machine_by_id("test").token == token
+        for worker in workers:
+            worker.storage.session.close()
+
+    def test_expired_lease_is_taken_over(
+        self, httpx_mock: HTTPXMock, client: CAPIClient
+    ):
+        machine = MachineModel(
+            "test", dummy_token(exp=1), "pass", "crowdsecurity/http-bf"
+        )
+        client.storage.update_or_create_machine(machine)
+        # a worker that died while logging the machine in
+        client.storage.acquire_machine_lease("test", "dead-worker", 0.5)
+        httpx_mock.add_response(
+            method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+        )
+
+        start = time.monotonic()
+        machine = client._refresh_machine_token(machine)
+
+        assert time.monotonic() - start >= 0.5
+        assert machine_token_is_valid(machine.token)
+        assert len(httpx_mock.get_requests()) == 1
+
+
+def unsaved_signals(count):
+    """Mock signals whose decisions don't have a database id yet"""
+    signals = [mock_signals()[0] for _ in range(count)]
+    for signal in signals:
+        signal.decisions[0].id = None
+    return signals
+
+
 def dummy_token(exp=None):
     if not exp:
         exp = int(time.time()) + 3600
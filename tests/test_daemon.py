@@ -0,0 +1,139 @@
+import json
+import time
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from cscapi.client import (
+    CAPI_SIGNALS_URL,
+    CAPI_WATCHER_LOGIN_URL,
+    CAPI_WATCHER_REGISTER_URL,
+    CAPIClient,
+)
+from cscapi.daemon import SignalDaemon, submit_signals
+from cscapi.sql_storage import SQLStorage
+from cscapi.storage import DecisionModel
+from cscapi.utils import create_signals
+
+from .test_client import dummy_token
+
+
+@pytest.fixture
+def client(tmp_path):
+    storage = SQLStorage(f"sqlite:///{tmp_path / 'daemon.db'}")
+    yield CAPIClient(storage)
+    storage.session.close()
+
+
+def make_signals(count):
+    return create_signals(
+        [f"10.0.0.{i}" for i in range(count)],
+        "crowdsecurity/ssh-bf",
+        [1700000000] * count,
+        "test",
+    )
+
+
+def test_submit_and_flush_on_stop(tmp_path, httpx_mock: HTTPXMock, client):
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+    )
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+    )
+    httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+
+    socket_path = str(tmp_path / "cscapi.sock")
+    daemon = SignalDaemon(client, socket_path, flush_interval=3600, batch_size=2)
+    daemon.start()
+    try:
+        assert submit_signals(make_signals(3), socket_path) == {
+            "accepted": 3,
+            "rejected": 0,
+        }
+        assert submit_signals(make_signals(2), socket_path)["accepted"] == 2
+    finally:
+        daemon.stop()
+
+    signal_requests = [
+        r for r in httpx_mock.get_requests() if r.url == CAPI_SIGNALS_URL
+    ]
+    assert len(signal_requests) == 1
+    # sent signals are pruned after the flush
+    assert client.storage.get_all_signals() == []
+
+
+def test_rejects_invalid_lines(tmp_path, client):
+    import socket
+
+    socket_path = str(tmp_path / "cscapi.sock")
+    daemon = SignalDaemon(client, socket_path, flush_interval=3600)
+    daemon.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(b"not json\n{}\n")
+            sock.shutdown(socket.SHUT_WR)
+            response = sock.makefile().readline()
+    finally:
+        daemon.stop()
+
+    assert response.strip() == '{"accepted": 0, "rejected": 2}'
+
+
+def test_bad_batch_does_not_break_storage(tmp_path, httpx_mock: HTTPXMock, client):
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+    )
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+    )
+    httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+    # two decisions with the same primary key make the batch fail
+    bad = make_signals(2)
+    for signal in bad:
+        signal.decisions = [DecisionModel(id=1, type="ban", value="10.0.0.1")]
+
+    socket_path = str(tmp_path / "cscapi.sock")
+    daemon = SignalDaemon(client, socket_path, flush_interval=3600, batch_size=2)
+    daemon.start()
+    try:
+        assert submit_signals(bad, socket_path)["accepted"] == 2
+        assert submit_signals(make_signals(1), socket_path)["accepted"] == 1
+    finally:
+        daemon.stop()
+
+    assert daemon.signals_dropped == 1
+    sent = [
+        signal
+        for request in httpx_mock.get_requests()
+        if request.url == CAPI_SIGNALS_URL
+        for signal in json.loads(request.content)
+    ]
+    assert len(sent) == 2
+
+
+def test_flushes_signals_stored_before_start(tmp_path, httpx_mock: HTTPXMock, client):
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+    )
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+    )
+    httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+    client.add_signals(make_signals(1))
+
+    # the daemon's worker owns the client's session, watch from another one
+    watcher = SQLStorage(f"sqlite:///{tmp_path / 'daemon.db'}")
+    socket_path = str(tmp_path / "cscapi.sock")
+    daemon = SignalDaemon(client, socket_path, flush_interval=0.2)
+    daemon.start()
+    try:
+        deadline = time.monotonic() + 5
+        while watcher.count_unsent_signals() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # flushed on schedule, without waiting for stop() or a new signal
+        assert watcher.count_unsent_signals() == 0
+    finally:
+        daemon.stop()
+        watcher.session.close()
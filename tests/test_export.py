@@ -0,0 +1,162 @@
+import ipaddress
+
+import pytest
+
+from cscapi.export import (
+    collapse,
+    decision_networks,
+    export_decisions,
+    read_networks,
+    write_networks,
+)
+
+
+def scope(value):
+    return "range" if "/" in value else "ip"
+
+
+def stream(new=(), deleted=()):
+    """A /decisions/stream response: new decisions grouped by scenario and
+    scope, deleted ones by scope as bare values"""
+    return {
+        "new": [
+            {
+                "scenario": "crowdsecurity/ssh-bf",
+                "scope": group,
+                "decisions": [
+                    {"duration": "3h", "value": value}
+                    for value in new
+                    if scope(value) == group
+                ],
+            }
+            for group in sorted({scope(value) for value in new})
+        ],
+        "deleted": [
+            {
+                "scope": group,
+                "decisions": [value for value in deleted if scope(value) == group],
+            }
+            for group in sorted({scope(value) for value in deleted})
+        ],
+    }
+
+
+def test_decision_networks_skips_non_network_decisions():
+    networks = decision_networks(
+        [
+            {"value": "1.2.3.4", "scope": "Ip", "type": "ban"},
+            {"value": "FR", "scope": "Country", "type": "ban"},
+            {"value": "5.6.7.8", "scope": "Ip", "type": "captcha"},
+            {"scenario": "x", "decisions": [{"value": "10.0.0.0/8"}]},
+        ]
+    )
+
+    assert networks == {
+        ipaddress.ip_network("1.2.3.4/32"),
+        ipaddress.ip_network("10.0.0.0/8"),
+    }
+
+
+def test_decision_networks_reads_stream_groups():
+    response = {
+        "new": [
+            {
+                "scenario": "crowdsecurity/ssh-bf",
+                "scope": "ip",
+                "decisions": [{"duration": "3h", "value": "1.2.3.4"}],
+            }
+        ],
+        "deleted": [
+            {"scope": "ip", "decisions": ["5.6.7.8", "::1"]},
+            {"scope": "country", "decisions": ["FR"]},
+        ],
+    }
+
+    assert decision_networks(response["new"]) == {ipaddress.ip_network("1.2.3.4")}
+    assert decision_networks(response["deleted"]) == {
+        ipaddress.ip_network("5.6.7.8"),
+        ipaddress.ip_network("::1"),
+    }
+
+
+def test_collapse_merges_adjacent_and_overlapping_ranges():
+    networks = [
+        ipaddress.ip_network(value)
+        for value in ("::2", "10.0.0.0/25", "10.0.0.128/25", "10.0.0.7", "1.2.3.4")
+    ]
+
+    assert [str(n) for n in collapse(networks)] == [
+        "1.2.3.4/32",
+        "10.0.0.0/24",
+        "::2/128",
+    ]
+
+
+def test_binary_round_trip(tmp_path):
+    networks = collapse(decision_networks(stream(["::1", "1.2.3.0/24"])["new"]))
+
+    write_networks(tmp_path / "list", networks)
+
+    assert read_networks(tmp_path / "list") == networks
+    assert (tmp_path / "list").stat().st_size == 13 + 5 + 17
+
+
+def test_export_nft_writes_deltas(tmp_path):
+    path, state = tmp_path / "ban.nft", tmp_path / "state"
+
+    report = export_decisions(
+        stream(["1.2.3.4", "10.0.0.0/25", "2001:db8::1"]), path, state_path=state
+    )
+
+    assert report.added == 3 and report.removed == 0
+    assert path.read_text().splitlines() == [
+        "flush set inet crowdsec crowdsec-blacklists",
+        "flush set inet crowdsec crowdsec6-blacklists",
+        "add element inet crowdsec crowdsec-blacklists { 1.2.3.4/32, 10.0.0.0/25 }",
+        "add element inet crowdsec crowdsec6-blacklists { 2001:db8::1/128 }",
+    ]
+
+    report = export_decisions(
+        stream(["10.0.0.128/25"], deleted=["1.2.3.4"]), path, state_path=state
+    )
+
+    assert (report.added, report.removed, report.total) == (1, 2, 2)
+    assert path.read_text().splitlines() == [
+        "delete element inet crowdsec crowdsec-blacklists { 1.2.3.4/32, 10.0.0.0/25 }",
+        "add element inet crowdsec crowdsec-blacklists { 10.0.0.0/24 }",
+    ]
+
+    report = export_decisions(stream(), path, state_path=state)
+
+    assert (report.added, report.removed) == (0, 0)
+    assert path.read_text() == ""
+
+
+def test_export_ipset_full(tmp_path):
+    path, state = tmp_path / "ban.ipset", tmp_path / "state"
+    export_decisions(stream(["1.2.3.4"]), path, "ipset", state_path=state)
+
+    export_decisions(stream(["1.2.3.5"]), path, "ipset", state_path=state, full=True)
+
+    assert path.read_text().splitlines() == [
+        "create crowdsec-blacklists hash:net family inet -exist",
+        "flush crowdsec-blacklists",
+        "create crowdsec6-blacklists hash:net family inet6 -exist",
+        "flush crowdsec6-blacklists",
+        "add crowdsec-blacklists 1.2.3.4/31 -exist",
+    ]
+
+
+def test_export_list_replaces_previous_decisions(tmp_path):
+    path, state = tmp_path / "ban.nft", tmp_path / "state"
+    export_decisions([{"value": "1.2.3.4"}], path, state_path=state)
+
+    report = export_decisions([{"value": "5.6.7.8"}], path, "binary", state_path=state)
+
+    assert report.total == 1
+    assert read_networks(path) == [ipaddress.ip_network("5.6.7.8/32")]
+
+
+def test_export_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_decisions([], tmp_path / "out", "iptables")
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = (
+    "dacite",
+    "dateutil",
+    "httpx",
+    "importlib.metadata",
+    "jwt",
+    "sqlalchemy",
+)
+
+
+@pytest.mark.parametrize(
+    "module", ["cscapi.client", "cscapi.utils", "cscapi.storage", "cscapi.metrics"]
+)
+def test_import_does_not_load_heavy_dependencies(module):
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert output == ""
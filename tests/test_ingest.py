@@ -0,0 +1,114 @@
+import csv
+import gzip
+import json
+
+import pytest
+
+from cscapi.ingest import ingest_file
+from cscapi.sql_storage import SQLStorage
+from cscapi.utils import generate_machine_id_from_key
+
+ROWS = [
+    {
+        "attacker_ip": "1.1.1.1",
+        "scenario": "crowdsecurity/ssh-bf",
+        "created_at": "2023-11-17T10:00:00Z",
+        "machine_key": "customer-1",
+    },
+    {
+        "attacker_ip": "2.2.2.2",
+        "scenario": "crowdsecurity/http-bf",
+        "created_at": "2023-11-17T10:00:01Z",
+        "machine_key": "customer-1",
+    },
+    {
+        "attacker_ip": "3.3.3.3",
+        "scenario": "crowdsecurity/ssh-bf",
+        "created_at": "2023-11-17T10:00:02Z",
+        "machine_id": "explicit",
+    },
+]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLStorage(f"sqlite:///{tmp_path / 'ingest.db'}")
+    yield storage
+    storage.session.close()
+
+
+def write_ndjson(path, rows, opener=open):
+    with opener(path, "wt") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def assert_ingested(storage):
+    signals = sorted(storage.get_all_signals(), key=lambda s: s.source.ip)
+    assert [s.source.ip for s in signals] == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+    machine_id = generate_machine_id_from_key("customer-1")
+    assert [s.machine_id for s in signals] == [machine_id, machine_id, "explicit"]
+    assert signals[0].created_at == "2023-11-17T10:00:00+0000"
+    assert not any(s.sent for s in signals)
+
+
+def test_ingest_ndjson(tmp_path, storage):
+    path = tmp_path / "signals.ndjson"
+    write_ndjson(path, ROWS)
+
+    report = ingest_file(str(path), storage, chunk_size=2)
+
+    assert report.rows == 3
+    assert report.rows_per_second > 0
+    assert_ingested(storage)
+
+
+def test_ingest_gzipped_ndjson(tmp_path, storage):
+    path = tmp_path / "signals.ndjson.gz"
+    write_ndjson(path, ROWS, opener=gzip.open)
+
+    assert ingest_file(str(path), storage).rows == 3
+    assert_ingested(storage)
+
+
+def test_ingest_csv(tmp_path, storage):
+    path = tmp_path / "signals.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f, ["attacker_ip", "scenario", "created_at", "machine_id", "machine_key"]
+        )
+        writer.writeheader()
+        writer.writerows(ROWS)
+
+    assert ingest_file(str(path), storage).rows == 3
+    assert_ingested(storage)
+
+
+def test_ingest_csv_with_epoch_timestamps(tmp_path, storage):
+    path = tmp_path / "signals.csv"
+    path.write_text(
+        "attacker_ip,scenario,created_at,machine_id\n"
+        "1.1.1.1,crowdsecurity/ssh-bf,1700215200,m\n"
+        "2.2.2.2,crowdsecurity/ssh-bf,1700215200.5,m\n"
+    )
+
+    assert ingest_file(str(path), storage).rows == 2
+    assert {s.created_at for s in storage.get_all_signals()} == {
+        "2023-11-17T10:00:00+0000"
+    }
+
+
+def test_ingest_skips_malformed_rows(tmp_path, storage):
+    path = tmp_path / "signals.ndjson"
+    with open(path, "w") as f:
+        f.write(json.dumps(ROWS[0]) + "\n")
+        f.write("not json\n")
+        f.write(json.dumps({**ROWS[1], "created_at": "yesterday-ish"}) + "\n")
+        f.write(json.dumps({"attacker_ip": "4.4.4.4"}) + "\n")
+        f.write(json.dumps(ROWS[1]) + "\n")
+        f.write(json.dumps(ROWS[2]) + "\n")
+
+    report = ingest_file(str(path), storage, chunk_size=2)
+
+    assert (report.rows, report.rows_skipped) == (3, 3)
+    assert_ingested(storage)
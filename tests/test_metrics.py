@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from cscapi.client import (
+    CAPI_SIGNALS_URL,
+    CAPI_WATCHER_LOGIN_URL,
+    CAPI_WATCHER_REGISTER_URL,
+    CAPIClient,
+)
+from cscapi.metrics import MetricsInterface, PrometheusMetrics
+from cscapi.sql_storage import SQLStorage
+
+from .test_client import dummy_token, mock_signals
+
+
+class RecordingMetrics(MetricsInterface):
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.observations = defaultdict(list)
+        self.gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((labels or {}).items())))
+
+    def increment(self, name, value=1, labels=None):
+        self.counters[self._key(name, labels)] += value
+
+    def observe(self, name, value, labels=None):
+        self.observations[self._key(name, labels)].append(value)
+
+    def gauge(self, name, value, labels=None):
+        self.gauges[self._key(name, labels)] = value
+
+
+def test_client_and_storage_metrics(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+    )
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+    )
+    httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+
+    metrics = RecordingMetrics()
+    storage = SQLStorage("sqlite://", metrics=metrics)
+    client = CAPIClient(storage, metrics=metrics)
+    client.add_signals(mock_signals())
+    client.send_signals()
+
+    for endpoint in ("register", "login", "signals"):
+        key = ("capi_requests_total", (("endpoint", endpoint), ("status", "200")))
+        assert metrics.counters[key] == 1
+        key = ("capi_request_duration_seconds", key[1])
+        assert len(metrics.observations[key]) == 1
+
+    assert metrics.observations[("signals_batch_size", ())] == [1]
+    [size] = metrics.observations[("signals_batch_bytes", ())]
+    assert size == len(httpx_mock.get_requests()[-1].content)
+    assert metrics.gauges[("signals_unsent", ())] == 1
+
+    operations = {
+        dict(labels)["operation"]
+        for name, labels in metrics.observations
+        if name == "storage_operation_duration_seconds"
+    }
+    assert {
+        "bulk_create_signals",
+        "get_all_signals",
+        "get_machine_by_id",
+        "update_or_create_machine",
+        "mark_signals_sent",
+    } <= operations
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    metrics = PrometheusMetrics(registry=registry)
+
+    labels = {"endpoint": "login", "status": "200"}
+    metrics.increment("capi_requests_total", labels=labels)
+    metrics.increment("capi_requests_total", labels=labels)
+    metrics.observe("signals_batch_size", 250)
+    metrics.gauge("signals_unsent", 12)
+
+    assert registry.get_sample_value("cscapi_capi_requests_total", labels) == 2
+    assert registry.get_sample_value("cscapi_signals_batch_size_sum") == 250
+    assert registry.get_sample_value("cscapi_signals_unsent") == 12
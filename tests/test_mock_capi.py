@@ -0,0 +1,87 @@
+import time
+
+import httpx
+import pytest
+
+from cscapi.client import CAPIClient, machine_token_is_valid
+from cscapi.mock_capi import MockCAPI
+from cscapi.sql_storage import SQLStorage
+
+from .test_client import unsaved_signals
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLStorage(f"sqlite:///{tmp_path / 'mock.db'}")
+    yield storage
+    storage.session.close()
+
+
+def add_signals(client, count):
+    signals = unsaved_signals(count)
+    for i, signal in enumerate(signals):
+        signal.machine_id = f"machine-{i % 2}"
+    client.add_signals(signals)
+
+
+def test_client_against_mock_capi(storage):
+    decisions = {"new": [{"value": "1.2.3.4", "scope": "Ip"}], "deleted": []}
+    with MockCAPI(decisions=decisions) as capi:
+        client = CAPIClient(storage, base_url=capi.base_url)
+        add_signals(client, 4)
+
+        report = client.send_signals()
+        first = client.get_decisions("machine-0", ["crowdsecurity/ssh-bf"])
+        second = client.get_decisions("machine-0", ["crowdsecurity/ssh-bf"])
+        [result] = client.enroll_machines(["machine-1"], "name", "key", [])
+        client.close()
+
+    assert report.signals_sent == 4
+    assert capi.signals_received == 4
+    assert set(capi.machines) == {"machine-0", "machine-1"}
+    assert machine_token_is_valid(storage.get_machine_by_id("machine-0").token)
+    assert first == second == decisions
+    assert client.decisions_cache_hits == 1
+    assert result.status == "enrolled"
+    assert capi.enrollments["machine-1"]["attachment_key"] == "key"
+    assert capi.requests[("decisions", 304)] == 1
+
+
+def test_mock_capi_expires_tokens(storage):
+    with MockCAPI(token_ttl=1) as capi:
+        client = CAPIClient(storage, base_url=capi.base_url)
+        add_signals(client, 1)
+        client.send_signals()
+        token = storage.get_machine_by_id("machine-0").token
+        time.sleep(1.1)
+
+        add_signals(client, 1)
+        report = client.send_signals()
+        client.close()
+
+    assert not machine_token_is_valid(token)
+    assert report.machines_logged_in == 1
+    assert capi.requests[("login", 200)] == 2
+
+
+def test_mock_capi_rejects_invalid_tokens():
+    with MockCAPI() as capi:
+        resp = httpx.post(
+            f"{capi.base_url}/signals", json=[], headers={"Authorization": "nope"}
+        )
+
+    assert resp.status_code == 401
+
+
+def test_mock_capi_injects_failures(storage):
+    with MockCAPI(throttle_rate=1.0) as capi:
+        client = CAPIClient(storage, base_url=capi.base_url)
+        add_signals(client, 1)
+
+        with pytest.raises(httpx.HTTPStatusError) as exc:
+            client.send_signals()
+        client.close()
+
+    assert exc.value.response.status_code == 429
+    assert exc.value.response.headers["Retry-After"] == "1"
+    assert storage.count_unsent_signals() == 1
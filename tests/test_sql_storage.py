@@ -1,18 +1,26 @@
+import asyncio
 import os
+import sqlite3
 import time
 from unittest import TestCase
 
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
 from cscapi.sql_storage import (
+    AsyncSQLStorage,
     ContextDBModel,
     DecisionDBModel,
     MachineDBModel,
     SignalDBModel,
+    SignalJSONDBModel,
     SourceDBModel,
     SQLStorage,
 )
 from cscapi.storage import MachineModel, SourceModel
 
-from .test_client import mock_signals
+from .test_client import mock_signals, unsaved_signals
 
 
 class TestSQLStorage(TestCase):
@@ -115,3 +123,351 @@ class TestSQLStorage(TestCase):
         signal = signals[0]
 
         assert signal.sent == True
+
+    def test_bulk_create_signals(self):
+        signals = unsaved_signals(3)
+        for i, signal in enumerate(signals):
+            signal.uuid = str(i)
+
+        self.storage.bulk_create_signals(signals)
+
+        retrieved = self.storage.get_all_signals()
+        assert sorted(s.uuid for s in retrieved) == ["0", "1", "2"]
+        assert self.storage.session.query(ContextDBModel).count() == 12
+        assert self.storage.session.query(DecisionDBModel).count() == 3
+        assert self.storage.session.query(SourceDBModel).count() == 3
+
+    def test_failed_write_is_rolled_back(self):
+        signals = [mock_signals()[0] for _ in range(2)]
+        for signal in signals:
+            signal.decisions[0].id = 1
+        with self.assertRaises(IntegrityError):
+            self.storage.bulk_create_signals(signals)
+
+        self.storage.bulk_create_signals([mock_signals()[0]])
+        assert len(self.storage.get_all_signals()) == 1
+
+    def test_delete_signals(self):
+        for i in range(3):
+            signal = unsaved_signals(1)[0]
+            signal.uuid = str(i)
+            self.storage.update_or_create_signal(signal)
+
+        signals = sorted(self.storage.get_all_signals(), key=lambda s: s.uuid)
+        self.storage.delete_signals(signals[:2])
+
+        remaining = self.storage.get_all_signals()
+        assert [s.uuid for s in remaining] == ["2"]
+        assert self.storage.session.query(ContextDBModel).count() == 4
+        assert self.storage.session.query(DecisionDBModel).count() == 1
+        assert self.storage.session.query(SourceDBModel).count() == 1
+
+    def test_delete_machines(self):
+        for machine_id in ("1", "2"):
+            self.storage.update_or_create_machine(MachineModel(machine_id=machine_id))
+
+        self.storage.delete_machines([MachineModel(machine_id="1")])
+
+        assert self.storage.get_machine_by_id("1") is None
+        assert self.storage.get_machine_by_id("2") is not None
+
+    def _insert_signals(self, count):
+        signals = unsaved_signals(count)
+        for i, signal in enumerate(signals):
+            signal.uuid = str(i)
+        self.storage.bulk_create_signals(signals)
+
+    def test_claim_signals(self):
+        self._insert_signals(5)
+        other = SQLStorage(f"sqlite:///{self.db_path}")
+
+        first = self.storage.claim_signals(2)
+        second = other.claim_signals(10)
+
+        assert len(first) == 2
+        assert len(second) == 3
+        assert not {s.alert_id for s in first} & {s.alert_id for s in second}
+        assert len(second[0].context) == 4
+        assert self.storage.claim_signals(10) == []
+        other.session.close()
+
+    def test_claim_signals_after_lease_expiry(self):
+        self._insert_signals(2)
+
+        claimed = self.storage.claim_signals(10, lease_seconds=-1)
+
+        assert len(claimed) == 2
+        assert len(self.storage.claim_signals(10)) == 2
+
+    def test_machine_lease(self):
+        self.storage.update_or_create_machine(MachineModel(machine_id="1"))
+        other = SQLStorage(f"sqlite:///{self.db_path}")
+
+        assert self.storage.acquire_machine_lease("1", "a", 30)
+        assert not other.acquire_machine_lease("1", "b", 30)
+        # not released by another holder
+        other.release_machine_lease("1", "b")
+        assert not other.acquire_machine_lease("1", "b", 30)
+
+        self.storage.release_machine_lease("1", "a")
+        assert other.acquire_machine_lease("1", "b", 30)
+        # leases don't touch the machine itself
+        self.storage.update_or_create_machine(MachineModel(machine_id="1", token="t"))
+        assert not self.storage.acquire_machine_lease("1", "a", 30)
+        other.session.close()
+
+    def test_machine_lease_expiry(self):
+        self.storage.update_or_create_machine(MachineModel(machine_id="1"))
+
+        assert self.storage.acquire_machine_lease("1", "a", -1)
+        assert self.storage.acquire_machine_lease("1", "b", 30)
+        # nothing to wait for on an unknown machine
+        assert self.storage.acquire_machine_lease("unknown", "b", 30)
+
+    def test_mark_signals_sent(self):
+        self._insert_signals(3)
+        claimed = self.storage.claim_signals(2)
+
+        self.storage.mark_signals_sent(claimed)
+
+        assert all(s.sent for s in claimed)
+        signals = {s.alert_id: s for s in self.storage.get_all_signals()}
+        assert sum(s.sent for s in signals.values()) == 2
+        assert all(signals[s.alert_id].sent for s in claimed)
+        # sent signals are never claimed again
+        assert len(self.storage.claim_signals(10)) == 1
+
+    def test_count_unsent_signals(self):
+        self._insert_signals(3)
+        self.storage.mark_signals_sent(self.storage.claim_signals(1))
+
+        assert self.storage.count_unsent_signals() == 2
+
+    def test_stats(self):
+        signals = unsaved_signals(4)
+        for i, signal in enumerate(signals):
+            signal.machine_id = "a" if i < 3 else "b"
+            signal.created_at = f"2026-10-1{i}T00:00:00+0000"
+        signals[0].sent = True
+        self.storage.bulk_create_signals(signals)
+        self.storage.update_or_create_machine(MachineModel(machine_id="a"))
+
+        stats = self.storage.stats()
+
+        assert stats.signals_sent == 1
+        assert stats.signals_unsent == 3
+        assert stats.unsent_by_machine == {"a": 2, "b": 1}
+        assert stats.oldest_unsent_created_at == "2026-10-11T00:00:00+0000"
+        assert stats.machines == 1
+
+    def test_external_engine(self):
+        engine = create_engine(f"sqlite:///{self.db_path}")
+
+        storage = SQLStorage(engine=engine, create_tables=False)
+        storage.update_or_create_machine(MachineModel(machine_id="1"))
+
+        assert storage.session.get_bind() is engine
+        assert self.storage.get_machine_by_id("1") is not None
+        storage.session.close()
+
+    def test_tables_are_optional(self):
+        engine = create_engine("sqlite://")
+
+        SQLStorage(engine=engine, create_tables=False)
+
+        assert inspect(engine).get_table_names() == []
+
+    def test_json_schema_without_normalized_tables(self):
+        engine = create_engine("sqlite://")
+        # tables created by the application's own migrations
+        for model in (SignalJSONDBModel, MachineDBModel):
+            model.__table__.create(engine)
+
+        storage = SQLStorage(engine=engine, schema="json", create_tables=False)
+        storage.bulk_create_signals([mock_signals()[0]])
+
+        assert len(storage.get_all_signals()) == 1
+        storage.session.close()
+
+    def test_caller_managed_transaction(self):
+        session_factory = sessionmaker(bind=create_engine(f"sqlite:///{self.db_path}"))
+        storage = SQLStorage(session_factory=session_factory, manage_transactions=False)
+
+        storage.update_or_create_machine(MachineModel(machine_id="1"))
+        assert storage.get_machine_by_id("1") is not None
+        storage.session.rollback()
+        assert storage.get_machine_by_id("1") is None
+
+        storage.update_or_create_machine(MachineModel(machine_id="2"))
+        assert self.storage.get_machine_by_id("2") is None
+        storage.session.commit()
+        assert self.storage.get_machine_by_id("2") is not None
+        storage.session.close()
+
+    def test_using_session(self):
+        session = sessionmaker(bind=create_engine(f"sqlite:///{self.db_path}"))()
+        signal = unsaved_signals(1)[0]
+
+        session.add(MachineDBModel(machine_id="app"))
+        SQLStorage.using_session(session).bulk_create_signals([signal])
+        session.rollback()
+        assert self.storage.get_all_signals() == []
+        assert self.storage.get_machine_by_id("app") is None
+
+        with session.begin():
+            session.add(MachineDBModel(machine_id="app"))
+            SQLStorage.using_session(session).bulk_create_signals([signal])
+        assert len(self.storage.get_all_signals()) == 1
+        assert self.storage.get_machine_by_id("app") is not None
+        session.close()
+
+    def test_missing_columns_are_added(self):
+        self.storage.session.close()
+        os.remove(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE signal_models (alert_id INTEGER PRIMARY KEY, "
+                "created_at VARCHAR, machine_id VARCHAR, sent BOOLEAN)"
+            )
+
+        self.storage = SQLStorage(f"sqlite:///{self.db_path}")
+
+        with sqlite3.connect(self.db_path) as conn:
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(signal_models)")
+            }
+        assert {"claimed_by", "claimed_until", "uuid", "scenario"} <= columns
+        with sqlite3.connect(self.db_path) as conn:
+            indexes = {
+                row[1] for row in conn.execute("PRAGMA index_list(signal_models)")
+            }
+        assert "ix_signal_models_sent_machine_id" in indexes
+
+    def _json_storage(self):
+        return SQLStorage(f"sqlite:///{self.db_path}", schema="json")
+
+    def test_json_schema_round_trip(self):
+        json_storage = self._json_storage()
+        signal = unsaved_signals(1)[0]
+
+        assert json_storage.update_or_create_signal(signal)
+        [retrieved] = json_storage.get_all_signals()
+        assert retrieved.source == signal.source
+        assert retrieved.context == signal.context
+        assert retrieved.decisions[0].value == signal.decisions[0].value
+
+        retrieved.sent = True
+        assert not json_storage.update_or_create_signal(retrieved)
+        assert json_storage.get_all_signals()[0].sent
+        assert json_storage.session.query(ContextDBModel).count() == 0
+        assert json_storage.session.query(SignalDBModel).count() == 0
+        json_storage.session.close()
+
+    def test_json_schema_bulk_claim_and_delete(self):
+        json_storage = self._json_storage()
+        signals = [mock_signals()[0] for _ in range(3)]
+        for i, signal in enumerate(signals):
+            signal.uuid = str(i)
+
+        json_storage.bulk_create_signals(signals)
+        assert json_storage.session.query(SignalJSONDBModel).count() == 3
+
+        claimed = json_storage.claim_signals(2)
+        assert len(claimed[0].context) == 4
+        json_storage.mark_signals_sent(claimed)
+        assert sum(s.sent for s in json_storage.get_all_signals()) == 2
+
+        json_storage.delete_signals(claimed)
+        [remaining] = json_storage.get_all_signals()
+        assert remaining.uuid not in {s.uuid for s in claimed}
+        json_storage.session.close()
+
+    def test_migrate_signals_to_json(self):
+        self._insert_signals(3)
+        [first, *_] = self.storage.get_all_signals()
+        self.storage.mark_signals_sent([first])
+        json_storage = self._json_storage()
+
+        assert json_storage.migrate_signals_to_json(batch_size=2) == 3
+
+        migrated = {s.alert_id: s for s in json_storage.get_all_signals()}
+        assert len(migrated) == 3
+        assert migrated[first.alert_id].sent
+        assert migrated[first.alert_id].source == first.source
+        assert sum(s.sent for s in migrated.values()) == 1
+        assert len(migrated[first.alert_id].context) == 4
+        for model in (SignalDBModel, SourceDBModel, ContextDBModel, DecisionDBModel):
+            assert json_storage.session.query(model).count() == 0
+        json_storage.session.close()
+
+    def test_migrate_after_json_writes(self):
+        self._insert_signals(2)
+        [first, second] = self.storage.get_all_signals()
+        self.storage.mark_signals_sent([first])
+        json_storage = self._json_storage()
+        # written in json mode before migrating, it takes the first alert_id
+        json_storage.bulk_create_signals(unsaved_signals(1))
+        [written] = json_storage.get_all_signals()
+        assert written.alert_id == first.alert_id
+
+        assert json_storage.migrate_signals_to_json() == 2
+
+        migrated = json_storage.get_all_signals()
+        assert len({s.alert_id for s in migrated}) == 3
+        assert sum(s.sent for s in migrated) == 1
+        assert second.alert_id in {s.alert_id for s in migrated}
+        json_storage.session.close()
+
+
+class TestAsyncSQLStorage(TestCase):
+    def setUp(self) -> None:
+        self.db_path = f"{str(int(time.time()))}-async.db"
+        self.storage = AsyncSQLStorage(f"sqlite+aiosqlite:///{self.db_path}")
+
+    def tearDown(self) -> None:
+        asyncio.run(self.storage.close())
+        try:
+            os.remove(self.db_path)
+        except:
+            pass
+
+    def test_machines(self):
+        async def run():
+            machine = MachineModel(machine_id="1", token="1", password="1")
+            assert await self.storage.update_or_create_machine(machine)
+            machine.token = "2"
+            assert not await self.storage.update_or_create_machine(machine)
+            assert (await self.storage.get_machine_by_id("1")).token == "2"
+            await self.storage.delete_machines([machine])
+            assert await self.storage.get_machine_by_id("1") is None
+
+        asyncio.run(run())
+
+    def test_signals(self):
+        signals = unsaved_signals(3)
+        for i, signal in enumerate(signals):
+            signal.uuid = str(i)
+
+        async def run():
+            await self.storage.bulk_create_signals(signals)
+            first, second = await asyncio.gather(
+                self.storage.claim_signals(2), self.storage.claim_signals(2)
+            )
+            assert len(first) + len(second) == 3
+            await self.storage.mark_signals_sent(first)
+            stored = await self.storage.get_all_signals()
+            assert sum(s.sent for s in stored) == len(first)
+            assert len(stored[0].context) == 4
+            await self.storage.delete_signals(stored)
+            assert await self.storage.get_all_signals() == []
+
+        asyncio.run(run())
+
+    def test_shares_database_with_sql_storage(self):
+        async def run():
+            await self.storage.update_or_create_signal(mock_signals()[0])
+
+        asyncio.run(run())
+        sync_storage = SQLStorage(f"sqlite:///{self.db_path}")
+        assert len(sync_storage.get_all_signals()) == 1
+        sync_storage.session.close()
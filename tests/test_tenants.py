@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from cscapi.client import (
+    CAPI_SIGNALS_URL,
+    CAPI_WATCHER_LOGIN_URL,
+    CAPI_WATCHER_REGISTER_URL,
+)
+from cscapi.sql_storage import SQLStorage
+from cscapi.tenants import TenantPool
+
+from .test_client import dummy_token, unsaved_signals
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = TenantPool(max_workers=1)
+    yield pool
+    for client in pool.clients.values():
+        client.storage.session.close()
+    pool.close()
+
+
+def add_tenant(pool, tmp_path, tenant_id, signal_count):
+    client = pool.add_tenant(
+        tenant_id, SQLStorage(f"sqlite:///{tmp_path / tenant_id}.db")
+    )
+    add_signals(client, tenant_id, signal_count)
+    return client
+
+
+def add_signals(client, machine_id, count):
+    signals = unsaved_signals(count)
+    for signal in signals:
+        signal.machine_id = machine_id
+    client.add_signals(signals)
+
+
+def mock_capi(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_LOGIN_URL, json={"token": dummy_token()}
+    )
+    httpx_mock.add_response(
+        method="POST", url=CAPI_WATCHER_REGISTER_URL, json={"message": "OK"}
+    )
+    httpx_mock.add_response(method="POST", url=CAPI_SIGNALS_URL, text="OK")
+
+
+def uploads(httpx_mock: HTTPXMock):
+    return [
+        [signal["machine_id"] for signal in json.loads(request.content)]
+        for request in httpx_mock.get_requests()
+        if request.url == CAPI_SIGNALS_URL
+    ]
+
+
+def test_tenants_share_the_http_client(pool, tmp_path):
+    a = add_tenant(pool, tmp_path, "a", 0)
+    b = add_tenant(pool, tmp_path, "b", 0)
+
+    assert a.http_client is b.http_client is pool.http_client
+    with pytest.raises(ValueError):
+        pool.add_tenant("a", a.storage)
+
+
+def test_flush_takes_turns(httpx_mock: HTTPXMock, pool, tmp_path):
+    mock_capi(httpx_mock)
+    add_tenant(pool, tmp_path, "a", 5)
+    add_tenant(pool, tmp_path, "b", 1)
+
+    report = pool.flush(signals_per_turn=2)
+
+    # a's backlog doesn't make b wait for all of it
+    assert uploads(httpx_mock) == [["a", "a"], ["b"], ["a", "a"], ["a"]]
+    assert report.turns == 4
+    assert report.signals_sent == 6
+    assert report.reports["a"].signals_sent == 5
+    assert report.reports["a"].signals_remaining == 0
+    assert report.failures == {}
+
+
+def test_flush_rotates_first_tenant(httpx_mock: HTTPXMock, pool, tmp_path):
+    mock_capi(httpx_mock)
+    a = add_tenant(pool, tmp_path, "a", 1)
+    b = add_tenant(pool, tmp_path, "b", 1)
+    pool.flush()
+    add_signals(a, "a", 1)
+    add_signals(b, "b", 1)
+
+    pool.flush()
+
+    assert uploads(httpx_mock) == [["a"], ["b"], ["b"], ["a"]]
+
+
+def test_flush_deadline(httpx_mock: HTTPXMock, pool, tmp_path):
+    add_tenant(pool, tmp_path, "a", 1)
+
+    report = pool.flush(deadline=0)
+
+    assert report.turns == 0
+    assert pool.clients["a"].storage.count_unsent_signals() == 1
+
+
+def test_flush_isolates_failures(httpx_mock: HTTPXMock, pool, tmp_path):
+    mock_capi(httpx_mock)
+    broken = add_tenant(pool, tmp_path, "a", 1)
+    add_tenant(pool, tmp_path, "b", 1)
+    broken.storage.claim_signals = None
+
+    report = pool.flush()
+
+    assert list(report.failures) == ["a"]
+    assert report.reports["b"].signals_sent == 1
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from cscapi.sql_storage import SQLStorage
+from cscapi.storage import MachineModel
+from cscapi.transfer import CopyReport, copy_storage, main
+
+from .test_client import unsaved_signals
+
+
+@pytest.fixture
+def src(tmp_path):
+    storage = SQLStorage(f"sqlite:///{tmp_path / 'src.db'}")
+    for i in range(5):
+        storage.update_or_create_machine(
+            MachineModel(
+                machine_id=f"machine-{i}",
+                token=f"token-{i}",
+                password=f"password-{i}",
+                scenarios="crowdsecurity/ssh-bf",
+            )
+        )
+    signals = unsaved_signals(12)
+    for i, signal in enumerate(signals):
+        signal.machine_id = f"machine-{i % 5}"
+        signal.sent = i % 3 == 0
+    storage.bulk_create_signals(signals)
+    yield storage
+    storage.session.close()
+
+
+def assert_copied(src, dst):
+    def key(signal):
+        return signal.machine_id, signal.sent, signal.source.ip
+
+    assert sorted(map(key, dst.get_all_signals())) == sorted(
+        map(key, src.get_all_signals())
+    )
+    for i in range(5):
+        assert dst.get_machine_by_id(f"machine-{i}") == src.get_machine_by_id(
+            f"machine-{i}"
+        )
+
+
+@pytest.mark.parametrize("schema", ["normalized", "json"])
+def test_copy_storage(src, tmp_path, schema):
+    dst = SQLStorage(f"sqlite:///{tmp_path / 'dst.db'}", schema=schema)
+    reports = []
+
+    report = copy_storage(
+        src, dst, batch_size=4, progress=lambda r: reports.append(r.signals)
+    )
+
+    assert (report.machines, report.signals) == (5, 12)
+    assert reports == [0, 0, 4, 8, 12]
+    assert_copied(src, dst)
+    assert dst.count_unsent_signals() == 8
+    dst.session.close()
+
+
+def test_copy_storage_into_a_storage_with_signals(src, tmp_path):
+    dst = SQLStorage(f"sqlite:///{tmp_path / 'dst.db'}")
+    dst.bulk_create_signals(unsaved_signals(3))
+
+    # decisions get new ids too, even when the same signals are copied twice
+    copy_storage(src, dst)
+    copy_storage(src, dst)
+
+    assert len(dst.get_all_signals()) == 3 + 2 * 12
+    dst.session.close()
+
+
+def test_copy_storage_updates_existing_machines(src, tmp_path):
+    dst = SQLStorage(f"sqlite:///{tmp_path / 'dst.db'}")
+    dst.update_or_create_machine(MachineModel(machine_id="machine-0", token="old"))
+
+    copy_storage(src, dst)
+
+    assert dst.get_machine_by_id("machine-0").token == "token-0"
+    dst.session.close()
+
+
+def test_copy_storage_resumes_from_checkpoint(src, tmp_path):
+    dst = SQLStorage(f"sqlite:///{tmp_path / 'dst.db'}")
+    checkpoint = tmp_path / "copy.checkpoint"
+
+    def interrupt(report):
+        if report.signals == 4:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        copy_storage(
+            src, dst, batch_size=4, checkpoint_path=str(checkpoint), progress=interrupt
+        )
+    saved = CopyReport(**json.loads(checkpoint.read_text()))
+    assert (saved.machines, saved.signals) == (5, 4)
+
+    report = copy_storage(src, dst, batch_size=4, checkpoint_path=str(checkpoint))
+
+    assert (report.machines, report.signals) == (5, 12)
+    assert_copied(src, dst)
+    dst.session.close()
+
+
+def test_main(src, tmp_path, capsys):
+    dst_path = tmp_path / "dst.db"
+    main(
+        [
+            f"sqlite:///{tmp_path / 'src.db'}",
+            f"sqlite:///{dst_path}",
+            "--dst-schema",
+            "json",
+        ]
+    )
+
+    assert "done: 5 machines, 12 signals" in capsys.readouterr().out
+    dst = SQLStorage(f"sqlite:///{dst_path}", schema="json")
+    assert_copied(src, dst)
+    dst.session.close()
@@ -0,0 +1,150 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from cscapi.storage import SourceModel
+from cscapi.utils import (
+    aggregate_signals,
+    create_signal,
+    create_signals,
+    format_timestamp,
+    generate_machine_id_from_key,
+    parse_timestamp,
+)
+
+
+class TestFormatTimestamp:
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "2020-11-28T10:20:47+01:00",
+            "2020-11-28T09:20:47Z",
+            "2020-11-28 10:20:47 +0100",
+            "Sat Nov 28 09:20:47 UTC 2020",
+            1606555247,
+            1606555247.0,
+            "1606555247",
+            "1606555247.0",
+            "20201128T092047Z",
+            datetime(2020, 11, 28, 9, 20, 47, tzinfo=timezone.utc),
+        ],
+    )
+    def test_formats(self, value):
+        assert format_timestamp(value) == "2020-11-28T09:20:47+0000"
+
+    # all-digit dates are not epoch seconds
+    @pytest.mark.parametrize("value", ["20201128", "2020-11-28"])
+    def test_dates(self, value):
+        assert parse_timestamp(value) == datetime(2020, 11, 28)
+
+
+class TestCreateSignal:
+    def test_create_signal(self):
+        signal = create_signal(
+            attacker_ip="1.2.3.4",
+            scenario="crowdsecurity/ssh-bf",
+            created_at="2020-11-28T10:20:47+01:00",
+            machine_id="test",
+        )
+        assert signal.source.ip == "1.2.3.4"
+        assert signal.source.scope == "ip"
+        assert signal.created_at == "2020-11-28T09:20:47+0000"
+        assert signal.start_at == signal.stop_at == signal.created_at
+        assert signal.scenario_trust == "manual"
+        assert signal.uuid
+
+
+class TestCreateSignals:
+    def test_matches_create_signal(self):
+        created_at = "2020-11-28T10:20:47+01:00"
+        machine_id = generate_machine_id_from_key("key")
+        expected = create_signal(
+            "1.2.3.4", "crowdsecurity/ssh-bf", created_at, machine_id
+        )
+
+        [signal] = create_signals(
+            ["1.2.3.4"], ["crowdsecurity/ssh-bf"], [created_at], [machine_id]
+        )
+
+        for field in (
+            "created_at",
+            "start_at",
+            "stop_at",
+            "scenario",
+            "machine_id",
+            "scenario_trust",
+            "context",
+            "decisions",
+            "sent",
+        ):
+            assert getattr(signal, field) == getattr(expected, field)
+        assert signal.source == SourceModel(ip="1.2.3.4", scope="ip")
+
+    def test_broadcast_and_extra_fields(self):
+        signals = create_signals(
+            ["1.1.1.1", "2.2.2.2", "3.3.3.3"],
+            "crowdsecurity/http-bf",
+            [1606555247, "2020-11-28T09:20:47Z", 1606555300],
+            "test",
+            message="bulk",
+            scenario_trust="trusted",
+        )
+        assert [s.source.ip for s in signals] == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+        assert {s.scenario for s in signals} == {"crowdsecurity/http-bf"}
+        assert {s.machine_id for s in signals} == {"test"}
+        assert {s.message for s in signals} == {"bulk"}
+        assert {s.scenario_trust for s in signals} == {"trusted"}
+        assert signals[0].created_at == signals[1].created_at
+        assert signals[2].created_at == "2020-11-28T09:21:40+0000"
+        assert len({s.uuid for s in signals}) == 3
+
+    def test_length_mismatch(self):
+        with pytest.raises(ValueError):
+            create_signals(["1.1.1.1", "2.2.2.2"], "a", [1606555247], "test")
+
+
+class TestAggregateSignals:
+    def make(self, created_at, ip="1.1.1.1", machine_id="test", scenario="a/b", **kw):
+        return create_signal(ip, scenario, created_at, machine_id, **kw)
+
+    def test_merges_within_window(self):
+        signals = [
+            self.make(
+                1700000000,
+                context=[{"key": "service", "value": "ssh"}],
+                decisions=[{"type": "ban", "scope": "ip", "value": "1.1.1.1"}],
+            ),
+            self.make(
+                1700000030,
+                context=[
+                    {"key": "service", "value": "ssh"},
+                    {"key": "user", "value": "root"},
+                ],
+                decisions=[{"type": "ban", "scope": "ip", "value": "1.1.1.1"}],
+            ),
+            self.make(1700000010),
+        ]
+
+        [merged] = aggregate_signals(signals, window=60)
+
+        assert merged.start_at == "2023-11-14T22:13:20+0000"
+        assert merged.stop_at == "2023-11-14T22:13:50+0000"
+        assert [(c.key, c.value) for c in merged.context] == [
+            ("service", "ssh"),
+            ("user", "root"),
+        ]
+        assert len(merged.decisions) == 1
+        # inputs are left untouched
+        assert signals[0].stop_at == "2023-11-14T22:13:20+0000"
+
+    def test_keeps_distinct_keys_and_windows_apart(self):
+        signals = [
+            self.make(1700000000),
+            self.make(1700000100),
+            self.make(1700000000, ip="2.2.2.2"),
+            self.make(1700000000, scenario="c/d"),
+            self.make(1700000000, machine_id="other"),
+        ]
+
+        assert len(aggregate_signals(signals, window=60)) == 5
+        assert len(aggregate_signals(signals, window=600)) == 4